@@ -1,17 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Response, status
 from typing import Optional, List, Dict, Any
+from datetime import datetime, timezone
 import logging
 import uuid
 
-from dependencies import get_db, internal_server_error_exception
+from database import SessionLocal
+from models import uuid7
 from schemas import ChatRequest, ChatResponse, ConversationCreate, ErrorResponse
 import crud
+from services.conversation_summary import summarize_conversation
 from services.lightrag import lightrag_service
+from services.query_cache import query_cache
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+# LightRAG query options for chat requests
+QUERY_MODE = "hybrid"  # Default mode, can be made configurable
+QUERY_TOP_K = 20
+
 # Create router
 router = APIRouter(
     prefix="/api/chat",
@@ -23,25 +30,75 @@ router = APIRouter(
 )
 
 
+async def persist_chat_turn(
+    conversation_id: uuid.UUID,
+    user_message_id: uuid.UUID,
+    user_content: str,
+    user_timestamp: datetime,
+    ai_message_id: uuid.UUID,
+    ai_content: str,
+    ai_timestamp: datetime,
+    sources: Optional[List[Dict[str, Any]]] = None,
+    title: Optional[str] = None
+) -> None:
+    """
+    Save the user's message, the AI's response and optional conversation title.
+    
+    Runs as a background task after the chat response has been sent,
+    so it uses its own database session. Both messages are written in
+    one transaction.
+    
+    Args:
+        conversation_id: UUID of the conversation
+        user_message_id: Pre-allocated UUID of the user message
+        user_content: User message content
+        user_timestamp: Time the user message was received
+        ai_message_id: Pre-allocated UUID of the AI message
+        ai_content: AI message content
+        ai_timestamp: Time the AI response was received
+        sources: Optional list of source documents
+        title: Optional generated conversation title
+    """
+    try:
+        async with SessionLocal() as db:
+            await crud.create_turn(
+                db=db,
+                conversation_id=conversation_id,
+                user_content=user_content,
+                ai_content=ai_content,
+                sources=sources,
+                title=title,
+                user_message_id=user_message_id,
+                ai_message_id=ai_message_id,
+                user_timestamp=user_timestamp,
+                ai_timestamp=ai_timestamp
+            )
+        logger.info("Saved chat turn: %s, %s", user_message_id, ai_message_id)
+        if title:
+            logger.info("Generated conversation title: %s", title)
+    except Exception as e:
+        logger.error("Failed to save chat turn %s: %s", user_message_id, e, exc_info=True)
+
+
 @router.post("/", response_model=ChatResponse)
 async def chat(
     request: ChatRequest,
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks
 ):
     """
     Handle chat interaction with the RAG system.
     
     This endpoint:
     1. Creates a new conversation if conversation_id is not provided
-    2. Saves the user's message to the database
-    3. Retrieves conversation history for context
-    4. Sends the query to LightRAG server
-    5. Saves the AI's response to the database
-    6. Returns the AI response with metadata
+    2. Retrieves conversation history (rolling summary + recent messages) for context
+    3. Sends the query to LightRAG server (or reuses a cached answer)
+    4. Returns the AI response with metadata
+    5. Saves the user's message and the AI's response to the database
+       in one transaction after the response is sent
     
     Args:
         request: ChatRequest containing message and optional conversation_id
-        db: Database session dependency
+        background_tasks: Background tasks run after the response is sent
         
     Returns:
         ChatResponse with AI response and conversation metadata
@@ -52,9 +109,12 @@ async def chat(
             - 500 for internal server errors
             - 503 if LightRAG service is unavailable
     """
-    try:
-        conversation_id = request.conversation_id
-        
+    conversation_id = request.conversation_id
+    user_timestamp = datetime.now(timezone.utc)
+    
+    # Steps 1-2 use a short-lived session, so no pooled connection is held
+    # (idle in transaction) while waiting for LightRAG
+    async with SessionLocal() as db:
         # Step 1: Handle conversation creation or validation
         if conversation_id is None:
             # Create a new conversation
@@ -63,95 +123,107 @@ async def chat(
                 title=None,  # Will be auto-generated later
                 user_id="default_user"  # TODO: Get from authentication
             )
-            conversation = crud.create_conversation(db, conversation_data)
+            conversation = await crud.create_conversation(db, conversation_data)
             conversation_id = conversation.id
-            logger.info(f"Created new conversation: {conversation_id}")
+            logger.info("Created new conversation: %s", conversation_id)
         else:
             # Validate existing conversation
-            conversation = crud.get_conversation(db, conversation_id)
+            conversation = await crud.get_conversation(db, conversation_id)
             if not conversation:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail=f"Conversation {conversation_id} not found"
                 )
-            logger.info(f"Using existing conversation: {conversation_id}")
-        
-        # Step 2: Save user's message
-        user_message = crud.create_user_message(
-            db=db,
-            conversation_id=conversation_id,
-            content=request.message
-        )
-        logger.info(f"Saved user message: {user_message.id}")
-        
-        # Step 3: Get conversation history for context
-        conversation_history = crud.get_conversation_history_for_lightrag(
-            db=db,
-            conversation_id=conversation_id,
-            max_messages=10  # Get last 10 messages for context
-        )
+            logger.info("Using existing conversation: %s", conversation_id)
         
-        # Step 4: Send query to LightRAG
+        # Step 2: Get conversation history for context (before the new message is stored):
+        # the rolling summary of older messages plus every later message verbatim
+        conversation_history = await crud.get_compact_history(db, conversation)
+    
+    # Step 3: Send query to LightRAG, unless the same question was
+    # answered recently with the same context
+    cached_response = query_cache.get(
+        query=request.message,
+        mode=QUERY_MODE,
+        top_k=QUERY_TOP_K,
+        conversation_history=conversation_history
+    )
+    if cached_response is None:
+        logger.info("Sending query to LightRAG: %s...", request.message[:100])
         try:
-            logger.info(f"Sending query to LightRAG: {request.message[:100]}...")
             lightrag_response = await lightrag_service.query(
                 query=request.message,
-                mode="hybrid",  # Default mode, can be made configurable
-                conversation_history=conversation_history[:-1] if conversation_history else None,  # Exclude the just-added message
+                mode=QUERY_MODE,
+                conversation_history=conversation_history or None,
+                history_turns=(len(conversation_history) + 1) // 2 or None,
                 response_type="Multiple Paragraphs",
-                top_k=20,
+                top_k=QUERY_TOP_K,
                 max_token_for_text_unit=4000,
                 max_token_for_global_context=4000,
                 max_token_for_local_context=4000
             )
-            
-            ai_response_text = lightrag_response.response
             logger.info("Received response from LightRAG")
             
         except Exception as e:
-            logger.error(f"LightRAG service error: {str(e)}")
+            logger.error("LightRAG service error: %s", e)
             raise HTTPException(
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                 detail="RAG service is currently unavailable. Please try again later."
             )
         
-        # Step 5: Extract sources (if any) from the response
-        # TODO: Parse sources from LightRAG response when available
-        sources = None  # Placeholder for now
-        
-        # Step 6: Save AI's response
-        ai_message = crud.create_ai_message(
-            db=db,
-            conversation_id=conversation_id,
-            content=ai_response_text,
-            sources=sources
-        )
-        logger.info(f"Saved AI message: {ai_message.id}")
-        
-        # Step 7: Auto-generate conversation title if this is the first exchange
-        if not conversation.title:
-            generated_title = crud.generate_conversation_title(db, conversation_id)
-            if generated_title:
-                crud.update_conversation_title(db, conversation_id, generated_title)
-                logger.info(f"Generated conversation title: {generated_title}")
-        
-        # Step 8: Return response
-        return ChatResponse(
-            conversation_id=conversation_id,
-            ai_message=ai_response_text,
-            sources=sources,
-            user_message_id=user_message.id,
-            ai_message_id=ai_message.id
-        )
-        
-    except HTTPException:
-        # Re-raise HTTP exceptions as-is
-        raise
-    except Exception as e:
-        logger.error(f"Unexpected error in chat endpoint: {str(e)}", exc_info=True)
-        raise internal_server_error_exception(
-            detail="An unexpected error occurred while processing your message"
+        query_cache.set(
+            query=request.message,
+            mode=QUERY_MODE,
+            response=lightrag_response,
+            top_k=QUERY_TOP_K,
+            conversation_history=conversation_history
         )
+    else:
+        logger.info("Using cached LightRAG response")
+        lightrag_response = cached_response
+    
+    ai_response_text = lightrag_response.response
+    
+    ai_timestamp = datetime.now(timezone.utc)
+    
+    # Step 4: Extract sources (if any) from the response
+    # TODO: Parse sources from LightRAG response when available
+    sources = None  # Placeholder for now
+    
+    # Step 5: Save both messages and, on the first exchange, the auto-generated
+    # conversation title once the response has been sent
+    user_message_id = uuid7()
+    ai_message_id = uuid7()
+    generated_title = None
+    if not conversation.title:
+        generated_title = crud.format_conversation_title(request.message)
+    
+    background_tasks.add_task(
+        persist_chat_turn,
+        conversation_id=conversation_id,
+        user_message_id=user_message_id,
+        user_content=request.message,
+        user_timestamp=user_timestamp,
+        ai_message_id=ai_message_id,
+        ai_content=ai_response_text,
+        ai_timestamp=ai_timestamp,
+        sources=sources,
+        title=generated_title
+    )
+    
+    # Fold older messages into the conversation summary after the turn is saved
+    background_tasks.add_task(summarize_conversation, conversation_id)
+    
+    # Step 6: Return response, serialized once by pydantic-core instead of
+    # being re-validated against response_model and encoded again
+    chat_response = ChatResponse(
+        conversation_id=conversation_id,
+        ai_message=ai_response_text,
+        sources=sources,
+        user_message_id=user_message_id,
+        ai_message_id=ai_message_id
+    )
+    return Response(content=chat_response.model_dump_json(), media_type="application/json")
 
 
 @router.post("/stream")
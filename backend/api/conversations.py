@@ -1,10 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, status, Query
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, List
+from datetime import datetime
 import logging
 from uuid import UUID
 
-from dependencies import get_db, not_found_exception, internal_server_error_exception
+from dependencies import get_db, not_found_exception
 from schemas import (
     ConversationCreate, ConversationResponse, ConversationSummary,
     MessageResponse, ErrorResponse, SuccessResponse
@@ -24,11 +26,15 @@ router = APIRouter(
     }
 )
 
+# Validators for list responses, built once at import time
+ConversationSummaryListAdapter = TypeAdapter(List[ConversationSummary])
+MessageResponseListAdapter = TypeAdapter(List[MessageResponse])
+
 
 @router.post("/new", response_model=ConversationResponse)
 async def create_new_conversation(
     conversation: ConversationCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Create a new conversation.
@@ -43,30 +49,21 @@ async def create_new_conversation(
     Raises:
         HTTPException: 500 for internal server errors
     """
-    try:
-        logger.info(f"Creating new conversation with title: {conversation.title}")
-        
-        # Create the conversation
-        db_conversation = crud.create_conversation(db, conversation)
-        
-        # Get message count (should be 0 for new conversation)
-        message_count = crud.get_conversation_message_count(db, db_conversation.id)
-        
-        logger.info(f"Created conversation: {db_conversation.id}")
-        
-        return ConversationResponse(
-            id=db_conversation.id,
-            title=db_conversation.title,
-            created_at=db_conversation.created_at,
-            user_id=db_conversation.user_id,
-            message_count=message_count
-        )
-        
-    except Exception as e:
-        logger.error(f"Error creating conversation: {str(e)}", exc_info=True)
-        raise internal_server_error_exception(
-            detail="Failed to create conversation"
-        )
+    logger.info("Creating new conversation with title: %s", conversation.title)
+    
+    # Create the conversation
+    db_conversation = await crud.create_conversation(db, conversation)
+    
+    logger.info("Created conversation: %s", db_conversation.id)
+    
+    # A new conversation has no messages yet
+    return ConversationResponse(
+        id=db_conversation.id,
+        title=db_conversation.title,
+        created_at=db_conversation.created_at,
+        user_id=db_conversation.user_id,
+        message_count=0
+    )
 
 
 @router.get("/", response_model=List[ConversationSummary])
@@ -74,7 +71,7 @@ async def get_conversations(
     user_id: Optional[str] = Query(None, description="Filter by user ID"),
     skip: int = Query(0, ge=0, description="Number of conversations to skip"),
     limit: int = Query(100, ge=1, le=1000, description="Maximum conversations to return"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get a list of conversations with summary information.
@@ -91,43 +88,27 @@ async def get_conversations(
     Raises:
         HTTPException: 500 for internal server errors
     """
-    try:
-        logger.info(f"Getting conversations for user: {user_id}, skip: {skip}, limit: {limit}")
-        
-        # Get conversations with summary data
-        conversations_data = crud.get_conversations_with_summary(
-            db=db,
-            user_id=user_id,
-            skip=skip,
-            limit=limit
-        )
-        
-        # Convert to response format
-        conversations = [
-            ConversationSummary(
-                id=conv['id'],
-                title=conv['title'],
-                created_at=conv['created_at'],
-                last_message_at=conv['last_message_at'],
-                message_count=conv['message_count']
-            )
-            for conv in conversations_data
-        ]
-        
-        logger.info(f"Retrieved {len(conversations)} conversations")
-        return conversations
-        
-    except Exception as e:
-        logger.error(f"Error retrieving conversations: {str(e)}", exc_info=True)
-        raise internal_server_error_exception(
-            detail="Failed to retrieve conversations"
-        )
+    logger.info("Getting conversations for user: %s, skip: %d, limit: %d", user_id, skip, limit)
+    
+    # Get conversations with summary data
+    conversations_data = await crud.get_conversations_with_summary(
+        db=db,
+        user_id=user_id,
+        skip=skip,
+        limit=limit
+    )
+    
+    # Convert to response format
+    conversations = ConversationSummaryListAdapter.validate_python(conversations_data)
+    
+    logger.info("Retrieved %d conversations", len(conversations))
+    return conversations
 
 
 @router.get("/{conversation_id}", response_model=ConversationResponse)
 async def get_conversation(
     conversation_id: UUID,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get a specific conversation by ID.
@@ -144,47 +125,40 @@ async def get_conversation(
             - 404 if conversation not found
             - 500 for internal server errors
     """
-    try:
-        logger.info(f"Getting conversation: {conversation_id}")
-        
-        # Get the conversation
-        conversation = crud.get_conversation(db, conversation_id)
-        if not conversation:
-            raise not_found_exception(f"Conversation {conversation_id} not found")
-        
-        # Get message count
-        message_count = crud.get_conversation_message_count(db, conversation_id)
-        
-        return ConversationResponse(
-            id=conversation.id,
-            title=conversation.title,
-            created_at=conversation.created_at,
-            user_id=conversation.user_id,
-            message_count=message_count
-        )
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Error retrieving conversation {conversation_id}: {str(e)}", exc_info=True)
-        raise internal_server_error_exception(
-            detail="Failed to retrieve conversation"
-        )
+    logger.info("Getting conversation: %s", conversation_id)
+    
+    conversation = await crud.get_conversation(db, conversation_id)
+    if not conversation:
+        raise not_found_exception(f"Conversation {conversation_id} not found")
+    
+    return ConversationResponse(
+        id=conversation.id,
+        title=conversation.title,
+        created_at=conversation.created_at,
+        user_id=conversation.user_id,
+        message_count=conversation.message_count
+    )
 
 
 @router.get("/{conversation_id}/messages", response_model=List[MessageResponse])
 async def get_conversation_messages(
     conversation_id: UUID,
-    skip: int = Query(0, ge=0, description="Number of messages to skip"),
-    limit: int = Query(1000, ge=1, le=10000, description="Maximum messages to return"),
-    db: Session = Depends(get_db)
+    before: Optional[datetime] = Query(None, description="Only return messages older than this timestamp"),
+    before_id: Optional[UUID] = Query(None, description="ID of the oldest message already loaded, to break timestamp ties"),
+    limit: int = Query(200, ge=1, le=1000, description="Maximum messages to return"),
+    db: AsyncSession = Depends(get_db)
 ):
     """
-    Get all messages for a specific conversation.
+    Get the messages of a specific conversation, latest page first.
+    
+    Without a cursor the most recent messages are returned. To load older
+    messages, pass the timestamp and ID of the oldest message received so far
+    as before and before_id.
     
     Args:
         conversation_id: UUID of the conversation
-        skip: Number of messages to skip (for pagination)
+        before: Only return messages older than this timestamp (for pagination)
+        before_id: ID of the message at the cursor
         limit: Maximum number of messages to return
         db: Database session dependency
         
@@ -196,51 +170,33 @@ async def get_conversation_messages(
             - 404 if conversation not found
             - 500 for internal server errors
     """
-    try:
-        logger.info(f"Getting messages for conversation: {conversation_id}")
-        
-        # Verify conversation exists
-        if not crud.conversation_exists(db, conversation_id):
-            raise not_found_exception(f"Conversation {conversation_id} not found")
-        
-        # Get messages
-        messages = crud.get_messages_by_conversation(
-            db=db,
-            conversation_id=conversation_id,
-            skip=skip,
-            limit=limit
-        )
-        
-        # Convert to response format
-        message_responses = [
-            MessageResponse(
-                id=message.id,
-                conversation_id=message.conversation_id,
-                sender=message.sender,
-                content=message.content,
-                sources=message.sources,
-                timestamp=message.timestamp
-            )
-            for message in messages
-        ]
-        
-        logger.info(f"Retrieved {len(message_responses)} messages")
-        return message_responses
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Error retrieving messages for conversation {conversation_id}: {str(e)}", exc_info=True)
-        raise internal_server_error_exception(
-            detail="Failed to retrieve messages"
-        )
+    logger.info("Getting messages for conversation: %s", conversation_id)
+    
+    # Verify conversation exists
+    if not await crud.conversation_exists(db, conversation_id):
+        raise not_found_exception(f"Conversation {conversation_id} not found")
+    
+    # Get messages
+    messages = await crud.get_messages_by_conversation(
+        db=db,
+        conversation_id=conversation_id,
+        before=before,
+        before_id=before_id,
+        limit=limit
+    )
+    
+    # Convert to response format
+    message_responses = MessageResponseListAdapter.validate_python(messages)
+    
+    logger.info("Retrieved %d messages", len(message_responses))
+    return message_responses
 
 
 @router.patch("/{conversation_id}/title", response_model=ConversationResponse)
 async def update_conversation_title(
     conversation_id: UUID,
     title: str = Query(..., min_length=1, max_length=255, description="New conversation title"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Update a conversation's title.
@@ -258,40 +214,29 @@ async def update_conversation_title(
             - 404 if conversation not found
             - 500 for internal server errors
     """
-    try:
-        logger.info(f"Updating title for conversation {conversation_id}: {title}")
-        
-        # Update the conversation title
-        updated_conversation = crud.update_conversation_title(db, conversation_id, title)
-        if not updated_conversation:
-            raise not_found_exception(f"Conversation {conversation_id} not found")
-        
-        # Get message count
-        message_count = crud.get_conversation_message_count(db, conversation_id)
-        
-        logger.info(f"Updated conversation title: {conversation_id}")
-        
-        return ConversationResponse(
-            id=updated_conversation.id,
-            title=updated_conversation.title,
-            created_at=updated_conversation.created_at,
-            user_id=updated_conversation.user_id,
-            message_count=message_count
-        )
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Error updating conversation title {conversation_id}: {str(e)}", exc_info=True)
-        raise internal_server_error_exception(
-            detail="Failed to update conversation title"
-        )
+    logger.info("Updating title for conversation %s: %s", conversation_id, title)
+    
+    # Update the conversation title (returns the message count as well)
+    result = await crud.update_conversation_title(db, conversation_id, title)
+    if not result:
+        raise not_found_exception(f"Conversation {conversation_id} not found")
+    updated_conversation, message_count = result
+    
+    logger.info("Updated conversation title: %s", conversation_id)
+    
+    return ConversationResponse(
+        id=updated_conversation.id,
+        title=updated_conversation.title,
+        created_at=updated_conversation.created_at,
+        user_id=updated_conversation.user_id,
+        message_count=message_count
+    )
 
 
 @router.delete("/{conversation_id}", response_model=SuccessResponse)
 async def delete_conversation(
     conversation_id: UUID,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Delete a conversation and all its messages.
@@ -308,25 +253,16 @@ async def delete_conversation(
             - 404 if conversation not found
             - 500 for internal server errors
     """
-    try:
-        logger.info(f"Deleting conversation: {conversation_id}")
-        
-        # Delete the conversation
-        deleted = crud.delete_conversation(db, conversation_id)
-        if not deleted:
-            raise not_found_exception(f"Conversation {conversation_id} not found")
-        
-        logger.info(f"Deleted conversation: {conversation_id}")
-        
-        return SuccessResponse(
-            success=True,
-            message=f"Conversation {conversation_id} deleted successfully"
-        )
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Error deleting conversation {conversation_id}: {str(e)}", exc_info=True)
-        raise internal_server_error_exception(
-            detail="Failed to delete conversation"
-        ) 
\ No newline at end of file
+    logger.info("Deleting conversation: %s", conversation_id)
+    
+    # Delete the conversation
+    deleted = await crud.delete_conversation(db, conversation_id)
+    if not deleted:
+        raise not_found_exception(f"Conversation {conversation_id} not found")
+    
+    logger.info("Deleted conversation: %s", conversation_id)
+    
+    return SuccessResponse(
+        success=True,
+        message=f"Conversation {conversation_id} deleted successfully"
+    )
\ No newline at end of file
@@ -1,17 +1,25 @@
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query
-from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
-from typing import Optional, List
+from fastapi.responses import FileResponse, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Final, Optional, List, Tuple
+import aiofiles
+import functools
+import hashlib
 import logging
 import os
-import shutil
 from pathlib import Path
 import mimetypes
+import stat
+from urllib.parse import quote
+from datetime import datetime, timezone
 from uuid import uuid4
 
-from dependencies import get_db, internal_server_error_exception, bad_request_exception
+from database import SessionLocal
+from dependencies import get_db, bad_request_exception
 from schemas import DocumentUploadResponse, DocumentListResponse, ErrorResponse
+import crud
 from services.lightrag import lightrag_service
+from services.query_cache import watch_indexing
 from config import settings
 
 # Set up logging
@@ -29,14 +37,23 @@ router = APIRouter(
     }
 )
 
+# Chunk size used when streaming uploads to disk
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+# Cached document listing, valid while the documents directory mtime is unchanged
+_LIST_CACHE = {"mtime": None, "payload": None}
+
 # Allowed file extensions for document upload
-ALLOWED_EXTENSIONS = {
+ALLOWED_EXTENSIONS: Final = frozenset({
     '.pdf', '.txt', '.doc', '.docx', '.md', '.rtf',
     '.csv', '.xlsx', '.xls', '.ppt', '.pptx'
-}
+})
+
+# Listed in error messages for rejected uploads
+_ALLOWED_EXTS_STR: Final = ", ".join(sorted(ALLOWED_EXTENSIONS))
 
 # Allowed MIME types
-ALLOWED_MIME_TYPES = {
+ALLOWED_MIME_TYPES: Final = frozenset({
     'application/pdf',
     'text/plain',
     'text/markdown',
@@ -47,7 +64,7 @@ ALLOWED_MIME_TYPES = {
     'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
     'application/vnd.ms-powerpoint',
     'application/vnd.openxmlformats-officedocument.presentationml.presentation'
-}
+})
 
 
 def validate_file(file: UploadFile) -> None:
@@ -66,12 +83,13 @@ def validate_file(file: UploadFile) -> None:
             f"File size {file.size} exceeds maximum allowed size {settings.max_file_size}"
         )
     
-    # Check file extension
+    # Check file extension (split the name directly instead of building a Path)
     if file.filename:
-        file_ext = Path(file.filename).suffix.lower()
+        stem, dot, ext = file.filename.rpartition("/")[2].rpartition(".")
+        file_ext = f".{ext.lower()}" if dot and stem else ""
         if file_ext not in ALLOWED_EXTENSIONS:
             raise bad_request_exception(
-                f"File type {file_ext} not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
+                f"File type {file_ext} not allowed. Allowed types: {_ALLOWED_EXTS_STR}"
             )
     
     # Check MIME type
@@ -81,49 +99,113 @@ def validate_file(file: UploadFile) -> None:
         )
 
 
-def save_uploaded_file(file: UploadFile, save_path: Path) -> None:
+async def save_uploaded_file(file: UploadFile, save_path: Path) -> Tuple[int, str]:
     """
-    Save uploaded file to local storage.
+    Stream uploaded file to local storage, hashing it on the way.
     
     Args:
         file: The uploaded file
         save_path: Path where to save the file
         
+    Returns:
+        Tuple of file size in bytes and SHA-256 hex digest of the content
+        
     Raises:
+        HTTPException: If the file exceeds the maximum allowed size
         Exception: If file saving fails
     """
     try:
         # Ensure directory exists
         save_path.parent.mkdir(parents=True, exist_ok=True)
         
-        # Save file
-        with open(save_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Save file chunk by chunk so it is never fully held in memory
+        hasher = hashlib.sha256()
+        file_size = 0
+        async with aiofiles.open(save_path, "wb") as buffer:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                file_size += len(chunk)
+                if file_size > settings.max_file_size:
+                    raise bad_request_exception(
+                        f"File size exceeds maximum allowed size {settings.max_file_size}"
+                    )
+                hasher.update(chunk)
+                await buffer.write(chunk)
             
-        logger.info(f"File saved to: {save_path}")
+        logger.info("File saved to: %s", save_path)
+        return file_size, hasher.hexdigest()
         
     except Exception as e:
-        logger.error(f"Failed to save file {save_path}: {str(e)}")
+        logger.error("Failed to save file %s: %s", save_path, e)
+        save_path.unlink(missing_ok=True)
         raise
 
 
+@functools.lru_cache(maxsize=64)
+def _mime_for_ext(ext: str) -> str:
+    """
+    Get the media type for a file extension.
+    
+    Args:
+        ext: Lowercase file extension including the dot (e.g. ".pdf")
+        
+    Returns:
+        Media type, or application/octet-stream if unknown
+    """
+    media_type, _ = mimetypes.guess_type(f"file{ext}")
+    return media_type or "application/octet-stream"
+
+
+def clear_list_cache() -> None:
+    """
+    Drop the cached document listing so the next request rescans the directory.
+    """
+    _LIST_CACHE["mtime"] = None
+    _LIST_CACHE["payload"] = None
+
+
+def scan_documents_dir(documents_dir: str) -> List[dict]:
+    """
+    Build the document listing for a directory.
+    
+    Uses os.scandir, which returns entry types with the directory listing
+    so only regular files need an extra stat call.
+    
+    Args:
+        documents_dir: Path of the documents directory
+        
+    Returns:
+        List of document info dictionaries
+    """
+    documents = []
+    with os.scandir(documents_dir) as entries:
+        for entry in entries:
+            if entry.is_file():
+                entry_stat = entry.stat()
+                documents.append({
+                    "filename": entry.name,
+                    "size": entry_stat.st_size,
+                    "modified": entry_stat.st_mtime,
+                    "url": f"/api/documents/{entry.name}"
+                })
+    return documents
+
+
 @router.post("/upload", response_model=DocumentUploadResponse)
 async def upload_document(
-    file: UploadFile = File(..., description="Document file to upload"),
-    db: Session = Depends(get_db)
+    file: UploadFile = File(..., description="Document file to upload")
 ):
     """
     Upload a document file and forward it to LightRAG for processing.
     
     This endpoint:
     1. Validates the uploaded file
-    2. Saves the file locally for serving
-    3. Forwards the file to LightRAG server for indexing
-    4. Returns upload status
+    2. Streams the file to local storage for serving
+    3. Returns the earlier upload if the same content was already uploaded
+    4. Forwards the saved file to LightRAG server for indexing
+    5. Returns upload status
     
     Args:
         file: The uploaded document file
-        db: Database session dependency
         
     Returns:
         DocumentUploadResponse with upload status
@@ -134,71 +216,82 @@ async def upload_document(
             - 500 for internal server errors
             - 503 if LightRAG service is unavailable
     """
+    logger.info("Uploading document: %s", file.filename)
+    
+    # Validate file
+    validate_file(file)
+    
+    # Generate unique filename while preserving original name
+    original_filename = file.filename or "unknown_file"
+    original_path = Path(original_filename)
+    original_name_without_ext = original_path.stem
+    file_ext = original_path.suffix
+    unique_id = str(uuid4())[:8]  # Use first 8 characters of UUID for shorter name
+    unique_filename = f"{original_name_without_ext}_{unique_id}{file_ext}"
+    
+    # Save file locally for serving
+    documents_dir = Path(settings.documents_dir)
+    local_save_path = documents_dir / unique_filename
+    file_size, file_digest = await save_uploaded_file(file, local_save_path)
+    
+    # Skip LightRAG indexing if the same content was uploaded before; sessions
+    # are kept short, so no pooled connection is held during the LightRAG upload
+    async with SessionLocal() as db:
+        existing_blob = await crud.get_uploaded_blob(db, file_digest)
+    
+    if existing_blob and (documents_dir / existing_blob.filename).is_file():
+        local_save_path.unlink()
+        logger.info("Duplicate upload of %s, skipping LightRAG indexing", existing_blob.filename)
+        
+        return DocumentUploadResponse(
+            status="success",
+            message=f"File '{existing_blob.filename}' was already uploaded to RAG system",
+            filename=existing_blob.filename,
+            file_size=existing_blob.size
+        )
+    
+    # Forward the saved file to LightRAG
+    started_at = datetime.now(timezone.utc)
     try:
-        logger.info(f"Uploading document: {file.filename}")
-        
-        # Validate file
-        validate_file(file)
-        
-        # Generate unique filename while preserving original name
-        original_filename = file.filename or "unknown_file"
-        original_name_without_ext = Path(original_filename).stem
-        file_ext = Path(original_filename).suffix
-        unique_id = str(uuid4())[:8]  # Use first 8 characters of UUID for shorter name
-        unique_filename = f"{original_name_without_ext}_{unique_id}{file_ext}"
-        
-        # Save file locally for serving
-        local_save_path = Path(settings.documents_dir) / unique_filename
-        
-        # Read file content for LightRAG
-        file_content = await file.read()
-        file_size = len(file_content)
-        
-        # Reset file pointer for local saving
-        file.file.seek(0)
-        
-        # Save file locally
-        save_uploaded_file(file, local_save_path)
-        
-        # Forward to LightRAG
-        try:
+        with open(local_save_path, "rb") as saved_file:
             lightrag_response = await lightrag_service.upload_document(
-                file_content=file_content,
+                file_stream=saved_file,
                 filename=unique_filename
             )
-            
-            logger.info(f"Document forwarded to LightRAG: {unique_filename}")
-            
-            return DocumentUploadResponse(
-                status="success",
-                message=f"File '{unique_filename}' uploaded successfully and sent to RAG system",
-                filename=unique_filename,  # Return the unique filename for future reference
-                file_size=file_size
-            )
-            
-        except Exception as e:
-            logger.error(f"LightRAG upload failed: {str(e)}")
-            # Delete locally saved file if LightRAG upload fails
-            if local_save_path.exists():
-                local_save_path.unlink()
-            
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="RAG service is currently unavailable. Please try again later."
-            )
-            
-    except HTTPException:
-        raise
+        
+        logger.info("Document forwarded to LightRAG: %s", unique_filename)
+        
     except Exception as e:
-        logger.error(f"Unexpected error during file upload: {str(e)}", exc_info=True)
-        raise internal_server_error_exception(
-            detail="Failed to upload document"
+        logger.error("LightRAG upload failed: %s", e)
+        # Delete locally saved file if LightRAG upload fails
+        if local_save_path.exists():
+            local_save_path.unlink()
+        
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="RAG service is currently unavailable. Please try again later."
         )
+    
+    # Remember the content so identical uploads are not indexed again
+    async with SessionLocal() as db:
+        await crud.save_uploaded_blob(db, file_digest, unique_filename, file_size)
+    
+    # The document listing is stale now; cached answers are dropped and caching
+    # is paused until LightRAG has indexed the document in the background
+    clear_list_cache()
+    watch_indexing(started_at)
+    
+    return DocumentUploadResponse(
+        status="success",
+        message=f"File '{unique_filename}' uploaded successfully and sent to RAG system",
+        filename=unique_filename,  # Return the unique filename for future reference
+        file_size=file_size
+    )
 
 
 @router.get("/list", response_model=DocumentListResponse)
 async def list_documents(
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get a list of uploaded documents available for serving.
@@ -209,32 +302,23 @@ async def list_documents(
     Raises:
         HTTPException: 500 for internal server errors
     """
+    logger.info("Listing available documents")
+    
     try:
-        logger.info("Listing available documents")
-        
-        documents = []
-        documents_dir = Path(settings.documents_dir)
-        
-        if documents_dir.exists():
-            for file_path in documents_dir.iterdir():
-                if file_path.is_file():
-                    stat = file_path.stat()
-                    documents.append({
-                        "filename": file_path.name,
-                        "size": stat.st_size,
-                        "modified": stat.st_mtime,
-                        "url": f"/api/documents/{file_path.name}"
-                    })
-        
-        logger.info(f"Found {len(documents)} documents")
-        
-        return DocumentListResponse(documents=documents)
-        
-    except Exception as e:
-        logger.error(f"Error listing documents: {str(e)}", exc_info=True)
-        raise internal_server_error_exception(
-            detail="Failed to list documents"
-        )
+        dir_mtime = os.stat(settings.documents_dir).st_mtime_ns
+    except FileNotFoundError:
+        return DocumentListResponse(documents=[])
+    
+    # Rescan only if files were added or removed since the last listing
+    if dir_mtime != _LIST_CACHE["mtime"]:
+        _LIST_CACHE["payload"] = scan_documents_dir(settings.documents_dir)
+        _LIST_CACHE["mtime"] = dir_mtime
+    
+    documents = _LIST_CACHE["payload"]
+    
+    logger.info("Found %d documents", len(documents))
+    
+    return DocumentListResponse(documents=documents)
 
 
 @router.get("/{filename}")
@@ -243,56 +327,63 @@ async def serve_document(filename: str):
     Serve a document file for download or viewing.
     
     This endpoint serves PDF files and other documents that were
-    previously uploaded to the system.
+    previously uploaded to the system. When documents_accel_redirect is
+    configured, the file body is sent by the reverse proxy through
+    X-Accel-Redirect instead of passing through the application.
     
     Args:
         filename: Name of the file to serve
         
     Returns:
-        FileResponse with the requested file
+        FileResponse with the requested file, or an X-Accel-Redirect response
         
     Raises:
         HTTPException: 
             - 404 if file not found
             - 500 for internal server errors
     """
+    logger.info("Serving document: %s", filename)
+    
+    # Construct file path
+    file_path = Path(settings.documents_dir) / filename
+    
+    # Check if file exists (one stat call, reused by FileResponse)
     try:
-        logger.info(f"Serving document: {filename}")
-        
-        # Construct file path
-        file_path = Path(settings.documents_dir) / filename
-        
-        # Check if file exists
-        if not file_path.exists() or not file_path.is_file():
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Document '{filename}' not found"
-            )
-        
-        # Determine media type
-        media_type, _ = mimetypes.guess_type(str(file_path))
-        if not media_type:
-            media_type = "application/octet-stream"
-        
-        logger.info(f"Serving file: {file_path} with media type: {media_type}")
-        
-        return FileResponse(
-            path=str(file_path),
-            media_type=media_type,
-            filename=filename
+        stat_result = os.stat(file_path)
+    except OSError:
+        stat_result = None
+    if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Document '{filename}' not found"
         )
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Error serving document {filename}: {str(e)}", exc_info=True)
-        raise internal_server_error_exception(
-            detail="Failed to serve document"
+    
+    # Determine media type
+    media_type = _mime_for_ext(file_path.suffix.lower())
+    
+    logger.info("Serving file: %s with media type: %s", file_path, media_type)
+    
+    # Let the reverse proxy send the file
+    if settings.documents_accel_redirect:
+        quoted_filename = quote(filename)
+        return Response(
+            media_type=media_type,
+            headers={
+                "X-Accel-Redirect": f"{settings.documents_accel_redirect.rstrip('/')}/{quoted_filename}",
+                "Content-Disposition": f"attachment; filename*=utf-8''{quoted_filename}"
+            }
         )
+    
+    return FileResponse(
+        path=str(file_path),
+        media_type=media_type,
+        filename=filename,
+        stat_result=stat_result
+    )
 
 
 @router.post("/scan")
-async def trigger_document_scan(db: Session = Depends(get_db)):
+async def trigger_document_scan(db: AsyncSession = Depends(get_db)):
     """
     Trigger document scanning on LightRAG server.
     
@@ -311,13 +402,15 @@ async def trigger_document_scan(db: Session = Depends(get_db)):
         logger.info("Triggering document scan on LightRAG")
         
         # Forward scan request to LightRAG
+        started_at = datetime.now(timezone.utc)
         scan_result = await lightrag_service.scan_documents()
+        watch_indexing(started_at)
         
         logger.info("Document scan triggered successfully")
         return scan_result
         
     except Exception as e:
-        logger.error(f"Document scan failed: {str(e)}")
+        logger.error("Document scan failed: %s", e)
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="RAG service is currently unavailable. Please try again later."
@@ -325,7 +418,7 @@ async def trigger_document_scan(db: Session = Depends(get_db)):
 
 
 @router.get("/pipeline/status")
-async def get_pipeline_status(db: Session = Depends(get_db)):
+async def get_pipeline_status(db: AsyncSession = Depends(get_db)):
     """
     Get the current document processing pipeline status from LightRAG.
     
@@ -346,7 +439,7 @@ async def get_pipeline_status(db: Session = Depends(get_db)):
         return status_result
         
     except Exception as e:
-        logger.error(f"Pipeline status request failed: {str(e)}")
+        logger.error("Pipeline status request failed: %s", e)
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="RAG service is currently unavailable. Please try again later."
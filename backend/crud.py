@@ -1,16 +1,21 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, func, select, text
-from typing import List, Optional, Dict, Any
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import delete, desc, exists, func, lambda_stmt, select, text, tuple_, update
+from typing import List, Optional, Dict, Any, Tuple
+from datetime import datetime, timedelta, timezone
 from uuid import UUID
 import uuid
 
-from models import Conversation, Message, MessageSender
+from models import Conversation, Message, MessageSender, UploadedBlob, utcnow
 from schemas import ConversationCreate, MessageCreate, ConversationSummary
 
+# LightRAG conversation history role for each message sender
+_ROLE = {MessageSender.USER: "user", MessageSender.AI: "assistant"}
+
 
 # === CONVERSATION CRUD OPERATIONS ===
 
-def create_conversation(db: Session, conversation: ConversationCreate) -> Conversation:
+async def create_conversation(db: AsyncSession, conversation: ConversationCreate) -> Conversation:
     """
     Create a new conversation in the database.
     
@@ -26,12 +31,11 @@ def create_conversation(db: Session, conversation: ConversationCreate) -> Conver
         user_id=conversation.user_id
     )
     db.add(db_conversation)
-    db.commit()
-    db.refresh(db_conversation)
+    await db.commit()
     return db_conversation
 
 
-def get_conversation(db: Session, conversation_id: UUID) -> Optional[Conversation]:
+async def get_conversation(db: AsyncSession, conversation_id: UUID) -> Optional[Conversation]:
     """
     Get a conversation by ID.
     
@@ -42,12 +46,12 @@ def get_conversation(db: Session, conversation_id: UUID) -> Optional[Conversatio
     Returns:
         Conversation model instance or None if not found
     """
-    stmt = select(Conversation).where(Conversation.id == conversation_id)
-    return db.execute(stmt).scalar_one_or_none()
+    stmt = lambda_stmt(lambda: select(Conversation).where(Conversation.id == conversation_id))
+    return (await db.execute(stmt)).scalar_one_or_none()
 
 
-def get_conversations(
-    db: Session, 
+async def get_conversations(
+    db: AsyncSession, 
     user_id: Optional[str] = None,
     skip: int = 0, 
     limit: int = 100
@@ -70,11 +74,11 @@ def get_conversations(
         stmt = stmt.where(Conversation.user_id == user_id)
     
     stmt = stmt.order_by(desc(Conversation.created_at)).offset(skip).limit(limit)
-    return db.execute(stmt).scalars().all()
+    return (await db.execute(stmt)).scalars().all()
 
 
-def get_conversations_with_summary(
-    db: Session, 
+async def get_conversations_with_summary(
+    db: AsyncSession, 
     user_id: Optional[str] = None,
     skip: int = 0, 
     limit: int = 100
@@ -89,56 +93,62 @@ def get_conversations_with_summary(
         limit: Maximum number of records to return
         
     Returns:
-        List of dictionaries with conversation summary data
-    """
+        List of row mappings with conversation summary data
+    """
+    # Resolved from the (conversation_id, timestamp) index for the page of
+    # conversations only, instead of aggregating all messages
+    last_message_at = (
+        select(func.max(Message.timestamp))
+        .where(Message.conversation_id == Conversation.id)
+        .correlate(Conversation)
+        .scalar_subquery()
+    )
     stmt = select(
         Conversation.id,
         Conversation.title,
         Conversation.created_at,
-        func.count(Message.id).label('message_count'),
-        func.max(Message.timestamp).label('last_message_at')
-    ).outerjoin(Message).group_by(Conversation.id)
+        Conversation.message_count,
+        last_message_at.label('last_message_at')
+    )
     
     if user_id:
         stmt = stmt.where(Conversation.user_id == user_id)
     
     stmt = stmt.order_by(desc(Conversation.created_at)).offset(skip).limit(limit)
-    result = db.execute(stmt).all()
-    
-    return [
-        {
-            'id': row.id,
-            'title': row.title,
-            'created_at': row.created_at,
-            'message_count': row.message_count or 0,
-            'last_message_at': row.last_message_at
-        }
-        for row in result
-    ]
+    return (await db.execute(stmt)).mappings().all()
 
 
-def update_conversation_title(db: Session, conversation_id: UUID, title: str) -> Optional[Conversation]:
+async def update_conversation_title(
+    db: AsyncSession,
+    conversation_id: UUID,
+    title: str
+) -> Optional[Tuple[Conversation, int]]:
     """
     Update a conversation's title.
     
+    The updated row is returned by the UPDATE statement itself, so no
+    second query is needed.
+    
     Args:
         db: Database session
         conversation_id: UUID of the conversation
         title: New title for the conversation
         
     Returns:
-        Updated Conversation model instance or None if not found
-    """
-    stmt = select(Conversation).where(Conversation.id == conversation_id)
-    db_conversation = db.execute(stmt).scalar_one_or_none()
-    if db_conversation:
-        db_conversation.title = title
-        db.commit()
-        db.refresh(db_conversation)
-    return db_conversation
+        Tuple of updated Conversation model instance and message count, or None if not found
+    """
+    stmt = (
+        update(Conversation)
+        .where(Conversation.id == conversation_id)
+        .values(title=title)
+        .returning(Conversation)
+    )
+    conversation = (await db.execute(stmt)).scalar_one_or_none()
+    await db.commit()
+    return (conversation, conversation.message_count) if conversation else None
 
 
-def delete_conversation(db: Session, conversation_id: UUID) -> bool:
+async def delete_conversation(db: AsyncSession, conversation_id: UUID) -> bool:
     """
     Delete a conversation and all its messages.
     
@@ -149,18 +159,33 @@ def delete_conversation(db: Session, conversation_id: UUID) -> bool:
     Returns:
         True if deleted successfully, False if not found
     """
-    stmt = select(Conversation).where(Conversation.id == conversation_id)
-    db_conversation = db.execute(stmt).scalar_one_or_none()
-    if db_conversation:
-        db.delete(db_conversation)
-        db.commit()
-        return True
-    return False
+    # Messages are removed by the ON DELETE CASCADE foreign key
+    stmt = delete(Conversation).where(Conversation.id == conversation_id)
+    deleted = (await db.execute(stmt)).rowcount
+    await db.commit()
+    return deleted > 0
 
 
 # === MESSAGE CRUD OPERATIONS ===
 
-def create_message(db: Session, message: MessageCreate) -> Message:
+async def _add_to_message_count(db: AsyncSession, conversation_id: UUID, delta: int) -> None:
+    """
+    Adjust a conversation's denormalized message count within the current transaction.
+    
+    Args:
+        db: Database session
+        conversation_id: UUID of the conversation
+        delta: Number of messages added (negative when removed)
+    """
+    stmt = (
+        update(Conversation)
+        .where(Conversation.id == conversation_id)
+        .values(message_count=Conversation.message_count + delta)
+    )
+    await db.execute(stmt)
+
+
+async def create_message(db: AsyncSession, message: MessageCreate) -> Message:
     """
     Create a new message in the database.
     
@@ -178,60 +203,78 @@ def create_message(db: Session, message: MessageCreate) -> Message:
         sources=message.sources
     )
     db.add(db_message)
-    db.commit()
-    db.refresh(db_message)
+    await _add_to_message_count(db, message.conversation_id, 1)
+    await db.commit()
     return db_message
 
 
-def create_user_message(db: Session, conversation_id: UUID, content: str) -> Message:
-    """
-    Convenience function to create a user message.
+async def create_turn(
+    db: AsyncSession,
+    conversation_id: UUID,
+    user_content: str,
+    ai_content: str,
+    sources: Optional[List[Dict[str, Any]]] = None,
+    title: Optional[str] = None,
+    user_message_id: Optional[UUID] = None,
+    ai_message_id: Optional[UUID] = None,
+    user_timestamp: Optional[datetime] = None,
+    ai_timestamp: Optional[datetime] = None
+) -> Tuple[Message, Message]:
+    """
+    Save a user message and the AI's response, and optionally set the conversation title, in a single transaction.
+    
+    Timestamps are set here rather than by the database, which would give
+    both messages the same transaction time; by default the user message
+    is placed just before the AI message.
     
     Args:
         db: Database session
         conversation_id: UUID of the conversation
-        content: Message content
+        user_content: User message content
+        ai_content: AI message content
+        sources: Optional list of source documents
+        title: Optional new conversation title
+        user_message_id: Optional pre-allocated UUID for the user message
+        ai_message_id: Optional pre-allocated UUID for the AI message
+        user_timestamp: Optional time the user message was sent
+        ai_timestamp: Optional time the AI response was received
         
     Returns:
-        Created Message model instance
+        Tuple of created user and AI Message model instances
     """
-    message_data = MessageCreate(
+    if ai_timestamp is None:
+        ai_timestamp = datetime.now(timezone.utc)
+    if user_timestamp is None:
+        user_timestamp = ai_timestamp - timedelta(microseconds=1)
+    
+    user_message = Message(
+        id=user_message_id,
         conversation_id=conversation_id,
         sender=MessageSender.USER,
-        content=content,
-        sources=None
+        content=user_content,
+        timestamp=user_timestamp
     )
-    return create_message(db, message_data)
-
-
-def create_ai_message(
-    db: Session, 
-    conversation_id: UUID, 
-    content: str, 
-    sources: Optional[List[Dict[str, Any]]] = None
-) -> Message:
-    """
-    Convenience function to create an AI message.
-    
-    Args:
-        db: Database session
-        conversation_id: UUID of the conversation
-        content: Message content
-        sources: Optional list of source documents
-        
-    Returns:
-        Created Message model instance
-    """
-    message_data = MessageCreate(
+    ai_message = Message(
+        id=ai_message_id,
         conversation_id=conversation_id,
         sender=MessageSender.AI,
-        content=content,
-        sources=sources
+        content=ai_content,
+        sources=sources,
+        timestamp=ai_timestamp
     )
-    return create_message(db, message_data)
+    db.add_all([user_message, ai_message])
+    
+    values = {"message_count": Conversation.message_count + 2}
+    if title:
+        values["title"] = title
+    stmt = update(Conversation).where(Conversation.id == conversation_id).values(**values)
+    await db.execute(stmt)
+    
+    await db.commit()
+    return user_message, ai_message
 
 
-def get_message(db: Session, message_id: UUID) -> Optional[Message]:
+async def get_message(db: AsyncSession, message_id: UUID) -> Optional[Message]:
     """
     Get a message by ID.
     
@@ -243,69 +286,132 @@ def get_message(db: Session, message_id: UUID) -> Optional[Message]:
         Message model instance or None if not found
     """
     stmt = select(Message).where(Message.id == message_id)
-    return db.execute(stmt).scalar_one_or_none()
+    return (await db.execute(stmt)).scalar_one_or_none()
 
 
-def get_messages_by_conversation(
-    db: Session, 
+async def get_messages_by_conversation(
+    db: AsyncSession, 
     conversation_id: UUID,
-    skip: int = 0,
-    limit: int = 1000
-) -> List[Message]:
+    before: Optional[datetime] = None,
+    before_id: Optional[UUID] = None,
+    limit: int = 200
+) -> List[Dict[str, Any]]:
     """
-    Get all messages for a specific conversation.
+    Get a page of messages for a specific conversation.
+    
+    Uses keyset pagination on (timestamp, id): the page holds the latest
+    messages older than the given cursor, so fetching older pages costs an
+    index seek instead of an OFFSET scan.
     
     Args:
         db: Database session
         conversation_id: UUID of the conversation
-        skip: Number of records to skip
+        before: Only return messages older than this timestamp
+        before_id: ID of the message at the cursor, to break timestamp ties
         limit: Maximum number of records to return
         
     Returns:
-        List of Message model instances ordered by timestamp
-    """
-    stmt = select(Message).where(
-        Message.conversation_id == conversation_id
-    ).order_by(Message.timestamp).offset(skip).limit(limit)
-    return db.execute(stmt).scalars().all()
+        List of row mappings with message data, ordered by timestamp
+    """
+    stmt = lambda_stmt(lambda: select(
+        Message.id,
+        Message.conversation_id,
+        Message.sender,
+        Message.content,
+        Message.sources,
+        Message.timestamp
+    ).where(Message.conversation_id == conversation_id))
+    
+    if before is not None:
+        if before_id is not None:
+            stmt += lambda s: s.where(tuple_(Message.timestamp, Message.id) < tuple_(before, before_id))
+        else:
+            stmt += lambda s: s.where(Message.timestamp < before)
+    
+    stmt += lambda s: s.order_by(desc(Message.timestamp), desc(Message.id)).limit(limit)
+    messages = (await db.execute(stmt)).mappings().all()
+    return messages[::-1]
 
 
-def get_conversation_history_for_lightrag(
-    db: Session, 
-    conversation_id: UUID,
-    max_messages: int = 10
-) -> List[Dict[str, str]]:
+async def get_compact_history(db: AsyncSession, conversation: Conversation) -> List[Dict[str, str]]:
     """
-    Get conversation history formatted for LightRAG API.
+    Get conversation history for LightRAG with older messages replaced by the rolling summary.
+    
+    Every message not yet folded into the summary is included, so none are
+    lost while a summary update is running or after one has failed.
+    
+    The summary is sent as a leading user/assistant turn, because LightRAG
+    only accepts those two roles and groups history into turns. It is only
+    rewritten every few turns, so this prefix stays the same between updates.
     
     Args:
         db: Database session
-        conversation_id: UUID of the conversation
-        max_messages: Maximum number of recent messages to include
+        conversation: Conversation model instance
         
     Returns:
         List of dictionaries with 'role' and 'content' keys for LightRAG
     """
-    stmt = select(Message).where(
-        Message.conversation_id == conversation_id
-    ).order_by(desc(Message.timestamp)).limit(max_messages)
-    messages = db.execute(stmt).scalars().all()
-    
-    # Reverse to get chronological order
-    messages.reverse()
+    messages = await get_unsummarized_messages(db, conversation)
+    history = [{"role": _ROLE[message.sender], "content": message.content} for message in messages]
     
-    history = []
-    for message in messages:
-        role = "user" if message.sender == MessageSender.USER else "assistant"
-        history.append({
-            "role": role,
-            "content": message.content
-        })
+    if conversation.summary:
+        history = [
+            {"role": "user", "content": "Summarize our conversation so far."},
+            {"role": "assistant", "content": conversation.summary}
+        ] + history
     
     return history
 
 
-def delete_message(db: Session, message_id: UUID) -> bool:
+async def get_unsummarized_messages(db: AsyncSession, conversation: Conversation) -> List[Any]:
+    """
+    Get the messages of a conversation that are not folded into its summary yet.
+    
+    Only the columns needed for summarizing are loaded, as plain rows.
+    
+    Args:
+        db: Database session
+        conversation: Conversation model instance
+        
+    Returns:
+        List of rows with sender, content and timestamp, ordered by timestamp
+    """
+    stmt = select(
+        Message.sender,
+        Message.content,
+        Message.timestamp
+    ).where(Message.conversation_id == conversation.id)
+    if conversation.summarized_until is not None:
+        stmt = stmt.where(Message.timestamp > conversation.summarized_until)
+    stmt = stmt.order_by(Message.timestamp, Message.id)
+    return (await db.execute(stmt)).all()
+
+
+async def update_conversation_summary(
+    db: AsyncSession,
+    conversation_id: UUID,
+    summary: str,
+    summarized_until: datetime
+) -> None:
+    """
+    Store a new rolling summary for a conversation.
+    
+    Args:
+        db: Database session
+        conversation_id: UUID of the conversation
+        summary: Updated summary text
+        summarized_until: Timestamp of the last message folded into the summary
+    """
+    stmt = update(Conversation).where(Conversation.id == conversation_id).values(
+        summary=summary,
+        summarized_until=summarized_until,
+        summary_updated_at=utcnow()
+    )
+    await db.execute(stmt)
+    await db.commit()
+
+
+async def delete_message(db: AsyncSession, message_id: UUID) -> bool:
     """
     Delete a specific message.
     
@@ -316,33 +422,56 @@ def delete_message(db: Session, message_id: UUID) -> bool:
     Returns:
         True if deleted successfully, False if not found
     """
-    stmt = select(Message).where(Message.id == message_id)
-    db_message = db.execute(stmt).scalar_one_or_none()
-    if db_message:
-        db.delete(db_message)
-        db.commit()
-        return True
-    return False
+    stmt = delete(Message).where(Message.id == message_id).returning(Message.conversation_id)
+    conversation_id = (await db.execute(stmt)).scalar_one_or_none()
+    if conversation_id is None:
+        return False
+    
+    await _add_to_message_count(db, conversation_id, -1)
+    await db.commit()
+    return True
+
 
+# === UPLOADED BLOB CRUD OPERATIONS ===
 
-def get_conversation_message_count(db: Session, conversation_id: UUID) -> int:
+async def get_uploaded_blob(db: AsyncSession, sha256: str) -> Optional[UploadedBlob]:
     """
-    Get the number of messages in a conversation.
+    Get a previously uploaded file by its content digest.
     
     Args:
         db: Database session
-        conversation_id: UUID of the conversation
+        sha256: Hex SHA-256 digest of the file content
         
     Returns:
-        Number of messages in the conversation
+        UploadedBlob model instance or None if not found
     """
-    stmt = select(func.count(Message.id)).where(Message.conversation_id == conversation_id)
-    return db.execute(stmt).scalar()
+    stmt = select(UploadedBlob).where(UploadedBlob.sha256 == sha256)
+    return (await db.execute(stmt)).scalar_one_or_none()
+
+
+async def save_uploaded_blob(db: AsyncSession, sha256: str, filename: str, size: int) -> None:
+    """
+    Record which stored file holds a given content digest.
+    
+    An existing record for the digest is replaced. If the digest was
+    recorded concurrently by another upload, that record is kept.
+    
+    Args:
+        db: Database session
+        sha256: Hex SHA-256 digest of the file content
+        filename: Stored filename
+        size: File size in bytes
+    """
+    await db.merge(UploadedBlob(sha256=sha256, filename=filename, size=size))
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
 
 
 # === UTILITY FUNCTIONS ===
 
-def conversation_exists(db: Session, conversation_id: UUID) -> bool:
+async def conversation_exists(db: AsyncSession, conversation_id: UUID) -> bool:
     """
     Check if a conversation exists.
     
@@ -353,32 +482,21 @@ def conversation_exists(db: Session, conversation_id: UUID) -> bool:
     Returns:
         True if conversation exists, False otherwise
     """
-    stmt = select(Conversation.id).where(Conversation.id == conversation_id)
-    return db.execute(stmt).scalar() is not None
+    stmt = lambda_stmt(lambda: select(exists().where(Conversation.id == conversation_id)))
+    return bool((await db.execute(stmt)).scalar())
 
 
-def generate_conversation_title(db: Session, conversation_id: UUID) -> Optional[str]:
+def format_conversation_title(content: str) -> str:
     """
-    Generate a title for a conversation based on the first user message.
+    Build a conversation title from a message.
     
     Args:
-        db: Database session
-        conversation_id: UUID of the conversation
+        content: Message content
         
     Returns:
-        Generated title or None if no messages found
-    """
-    stmt = select(Message).where(
-        Message.conversation_id == conversation_id,
-        Message.sender == MessageSender.USER
-    ).order_by(Message.timestamp)
-    first_message = db.execute(stmt).scalar()
-    
-    if first_message:
-        # Use first 50 characters of the first message as title
-        title = first_message.content[:50].strip()
-        if len(first_message.content) > 50:
-            title += "..."
-        return title
-    
-    return None 
\ No newline at end of file
+        First 50 characters of the message, with an ellipsis if it was cut
+    """
+    title = content[:50].strip()
+    if len(content) > 50:
+        title += "..."
+    return title
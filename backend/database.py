@@ -1,54 +1,63 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
 from sqlalchemy.pool import StaticPool
 from config import settings
 
-# Create database engine
-engine = create_engine(
-    settings.database_url,
-    poolclass=StaticPool,
-    echo=settings.debug,  # Log SQL statements in debug mode
-    pool_pre_ping=True,  # Verify connections before use
-    connect_args={
-        "client_encoding": "utf8",  # Force UTF-8 encoding
-        "options": "-c client_encoding=utf8 -c lc_messages=C -c lc_monetary=C -c lc_numeric=C -c lc_time=C"
-    }
-)
+# Create async database engine
+if settings.is_sqlite:
+    # SQLite is only used for tests; StaticPool keeps in-memory databases
+    # alive by sharing a single connection
+    engine = create_async_engine(
+        settings.async_database_url,
+        echo=settings.debug,  # Log SQL statements in debug mode
+        poolclass=StaticPool,
+        connect_args={"check_same_thread": False}
+    )
+else:
+    engine = create_async_engine(
+        settings.async_database_url,
+        echo=settings.debug,  # Log SQL statements in debug mode
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,  # Fail fast instead of queuing when the pool is exhausted
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=True,  # Verify connections before use
+        connect_args={
+            # Force UTF-8 encoding and C locale for server messages/formatting
+            "server_settings": {
+                "client_encoding": "utf8",
+                "lc_messages": "C",
+                "lc_monetary": "C",
+                "lc_numeric": "C",
+                "lc_time": "C"
+            }
+        }
+    )
 
 # Create SessionLocal class
-SessionLocal = sessionmaker(
-    autocommit=False,
+SessionLocal = async_sessionmaker(
+    bind=engine,
     autoflush=False,
-    bind=engine
+    expire_on_commit=False
 )
 
 # Create Base class for models
 Base = declarative_base()
 
 
-def get_database():
-    """
-    Database session dependency.
-    Used with FastAPI's Depends() to inject database sessions into route handlers.
-    """
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
-def create_tables():
+async def create_tables():
     """
     Create all tables defined by SQLAlchemy models.
     This should be called at application startup.
     """
-    Base.metadata.create_all(bind=engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
 
 
-def drop_tables():
+async def drop_tables():
     """
     Drop all tables. Use with caution!
     This is mainly for development/testing purposes.
     """
-    Base.metadata.drop_all(bind=engine) 
\ No newline at end of file
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
\ No newline at end of file
@@ -1,14 +1,14 @@
 from fastapi import Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import Generator
-from database import get_database
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import AsyncGenerator
+from database import SessionLocal
 import logging
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
 
-def get_db() -> Generator[Session, None, None]:
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
     """
     FastAPI dependency to get database session.
     
@@ -16,23 +16,10 @@ def get_db() -> Generator[Session, None, None]:
     to inject database sessions into route handlers.
     
     Yields:
-        Database session
-        
-    Raises:
-        HTTPException: If database connection fails
+        Async database session
     """
-    try:
-        db = next(get_database())
+    async with SessionLocal() as db:
         yield db
-    except Exception as e:
-        logger.error(f"Database connection error: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Database service unavailable"
-        )
-    finally:
-        if 'db' in locals():
-            db.close()
 
 
 def get_current_user_id() -> str:
@@ -53,7 +40,7 @@ def get_current_user_id() -> str:
 def validate_conversation_access(
     conversation_id: str,
     current_user_id: str = Depends(get_current_user_id),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Dependency to validate that a user has access to a conversation.
@@ -77,42 +64,6 @@ def validate_conversation_access(
     return conversation_id
 
 
-class DatabaseDependency:
-    """
-    Class-based dependency for database session management.
-    
-    This can be used as an alternative to the function-based get_db dependency
-    for more complex scenarios or when you need to maintain state.
-    """
-    
-    def __init__(self):
-        self.db: Session = None
-    
-    def __call__(self) -> Session:
-        """
-        Get database session.
-        
-        Returns:
-            Database session
-        """
-        try:
-            self.db = next(get_database())
-            return self.db
-        except Exception as e:
-            logger.error(f"Database connection error: {str(e)}")
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="Database service unavailable"
-            )
-    
-    def close(self):
-        """Close the database session if it exists."""
-        if self.db:
-            self.db.close()
-            self.db = None
-
-
-# Common HTTP exception responses
 def not_found_exception(detail: str = "Resource not found"):
     """
     Create a standardized 404 Not Found exception.
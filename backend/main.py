@@ -1,34 +1,41 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse
 from fastapi.exceptions import RequestValidationError
+import asyncio
 import logging
+import queue
 import time
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime
 from contextlib import asynccontextmanager
 from sqlalchemy import text
 
 # Import configuration and database
 from config import settings
-from database import create_tables, engine
+from database import SessionLocal, create_tables, engine
 
 # Import API routers
 from api.chat import router as chat_router
 from api.conversations import router as conversations_router
 from api.documents import router as documents_router
 
-# Import schemas for responses
-from schemas import ErrorResponse, HealthCheckResponse
+# Import dependencies and schemas for responses
+from dependencies import service_unavailable_exception
+from schemas import ErrorResponse, HealthCheckResponse, ServicesStatus
 
 # Import services
 from services.lightrag import lightrag_service
+from services.query_cache import cancel_indexing_watches, query_cache
 
 # Configure logging
 logging.basicConfig(
     level=logging.INFO if not settings.debug else logging.DEBUG,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
+
 logger = logging.getLogger(__name__)
 
 
@@ -39,24 +46,31 @@ async def lifespan(app: FastAPI):
     Handles startup and shutdown events.
     """
     # Startup
+    # Hand log records to a background thread so formatting and writing to
+    # stderr never block the event loop; the root handlers do the output
+    root_handlers = logging.root.handlers
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    log_listener = QueueListener(log_queue, *root_handlers, respect_handler_level=True)
+    logging.root.handlers = [QueueHandler(log_queue)]
+    log_listener.start()
     logger.info("Starting up RAG System Backend...")
     
     try:
         # Create database tables
-        create_tables()
+        await create_tables()
         logger.info("Database tables created/verified")
         
-        # Test LightRAG connection
+        # Test LightRAG connection (also opens the first pooled keep-alive connection)
         try:
             await lightrag_service.health_check()
             logger.info("LightRAG service connection verified")
         except Exception as e:
-            logger.warning(f"LightRAG service not available at startup: {str(e)}")
+            logger.warning("LightRAG service not available at startup: %s", e)
         
         logger.info("Application startup completed successfully")
         
     except Exception as e:
-        logger.error(f"Error during startup: {str(e)}")
+        logger.error("Error during startup: %s", e)
         raise
     
     yield  # Application runs here
@@ -65,14 +79,25 @@ async def lifespan(app: FastAPI):
     logger.info("Shutting down RAG System Backend...")
     
     try:
+        # Stop waiting for LightRAG indexing before its client is closed
+        await cancel_indexing_watches()
+        
         # Close database connections
-        engine.dispose()
+        await engine.dispose()
         logger.info("Database connections closed")
         
+        # Close pooled LightRAG connections
+        await lightrag_service.aclose()
+        logger.info("LightRAG client closed")
+        
         logger.info("Application shutdown completed")
         
     except Exception as e:
-        logger.error(f"Error during shutdown: {str(e)}")
+        logger.error("Error during shutdown: %s", e)
+    
+    # Flush remaining log records, stop the logging thread and log directly again
+    log_listener.stop()
+    logging.root.handlers = root_handlers
 
 
 # Create FastAPI application
@@ -82,6 +107,7 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs" if settings.debug else None,
     redoc_url="/redoc" if settings.debug else None,
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -94,11 +120,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Add trusted host middleware for security
-app.add_middleware(
-    TrustedHostMiddleware,
-    allowed_hosts=["*"]  # Configure this for production
-)
+# Add trusted host middleware for security; a wildcard would accept every
+# Host header, so the middleware is only mounted for a real host list
+if not settings.debug and settings.trusted_hosts and "*" not in settings.trusted_hosts:
+    app.add_middleware(
+        TrustedHostMiddleware,
+        allowed_hosts=settings.trusted_hosts
+    )
+
+
+# Paths hit by health probes; their requests are timed but not logged
+QUIET_PATHS = frozenset({"/", "/health", "/ready", "/version"})
 
 
 # Middleware for request logging and timing
@@ -107,33 +139,36 @@ async def log_requests(request: Request, call_next):
     """
     Middleware to log incoming requests and response times.
     """
-    start_time = time.time()
+    start_time = time.perf_counter()
+    log_request = request.url.path not in QUIET_PATHS
     
     # Log incoming request
-    logger.info(f"Incoming request: {request.method} {request.url}")
+    if log_request:
+        logger.info("Incoming request: %s %s", request.method, request.url)
     
     try:
         response = await call_next(request)
         
         # Calculate processing time
-        process_time = time.time() - start_time
+        process_time = time.perf_counter() - start_time
         
         # Log response
-        logger.info(
-            f"Request completed: {request.method} {request.url} - "
-            f"Status: {response.status_code} - Time: {process_time:.3f}s"
-        )
+        if log_request:
+            logger.info(
+                "Request completed: %s %s - Status: %d - Time: %.3fs",
+                request.method, request.url, response.status_code, process_time
+            )
         
         # Add processing time to response headers
-        response.headers["X-Process-Time"] = str(process_time)
+        response.headers["X-Process-Time"] = f"{process_time * 1000:.1f}ms"
         
         return response
         
     except Exception as e:
-        process_time = time.time() - start_time
+        process_time = time.perf_counter() - start_time
         logger.error(
-            f"Request failed: {request.method} {request.url} - "
-            f"Error: {str(e)} - Time: {process_time:.3f}s"
+            "Request failed: %s %s - Error: %s - Time: %.3fs",
+            request.method, request.url, e, process_time
         )
         raise
 
@@ -144,13 +179,13 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
     """
     Handle request validation errors.
     """
-    logger.warning(f"Validation error for {request.url}: {exc}")
-    return JSONResponse(
+    logger.warning("Validation error for %s: %s", request.url, exc)
+    return ORJSONResponse(
         status_code=422,
         content={
             "error": "Validation Error",
             "detail": "Invalid request data",
-            "errors": exc.errors()
+            "errors": jsonable_encoder(exc.errors())
         }
     )
 
@@ -160,8 +195,8 @@ async def http_exception_handler(request: Request, exc: HTTPException):
     """
     Handle HTTP exceptions.
     """
-    logger.warning(f"HTTP exception for {request.url}: {exc.status_code} - {exc.detail}")
-    return JSONResponse(
+    logger.warning("HTTP exception for %s: %s - %s", request.url, exc.status_code, exc.detail)
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={
             "error": "HTTP Error",
@@ -175,15 +210,18 @@ async def http_exception_handler(request: Request, exc: HTTPException):
 async def general_exception_handler(request: Request, exc: Exception):
     """
     Handle general exceptions.
+    
+    This is the single place where unexpected errors from the API routers
+    are logged and turned into a 500 response.
     """
-    logger.error(f"Unhandled exception for {request.url}: {str(exc)}", exc_info=True)
-    return JSONResponse(
+    logger.error("Unhandled exception for %s %s: %s", request.method, request.url, exc, exc_info=True)
+    return ORJSONResponse(
         status_code=500,
-        content={
-            "error": "Internal Server Error",
-            "detail": "An unexpected error occurred",
-            "status_code": 500
-        }
+        content=ErrorResponse(
+            error="Internal Server Error",
+            detail="An unexpected error occurred",
+            status_code=500
+        ).model_dump()
     )
 
 
@@ -203,67 +241,132 @@ async def root():
         "name": settings.app_name,
         "version": "1.0.0",
         "status": "running",
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": datetime.utcnow(),
         "docs_url": "/docs" if settings.debug else None
     }
 
 
+# Seconds a health check result is reused, so frequent probes do not
+# hit the database and LightRAG on every request
+HEALTH_CACHE_TTL = 5.0
+
+_health_cache = {"t": 0.0, "value": None}
+_health_lock = asyncio.Lock()
+
+
+async def check_database() -> str:
+    """
+    Check the database connection.
+    
+    Returns:
+        "healthy" or "unhealthy"
+    """
+    try:
+        async with SessionLocal() as db:
+            await db.execute(text("SELECT 1"))
+        return "healthy"
+    except Exception as e:
+        logger.error("Database health check failed: %s", e)
+        return "unhealthy"
+
+
+async def check_lightrag() -> str:
+    """
+    Check the LightRAG service.
+    
+    Returns:
+        "healthy" or "unhealthy"
+    """
+    try:
+        await lightrag_service.health_check()
+        return "healthy"
+    except Exception as e:
+        logger.warning("LightRAG health check failed: %s", e)
+        return "unhealthy"
+
+
+async def check_services() -> HealthCheckResponse:
+    """
+    Check the database and LightRAG service concurrently.
+    
+    Returns:
+        HealthCheckResponse with system status information
+    """
+    db_status, lightrag_status = await asyncio.gather(check_database(), check_lightrag())
+    
+    # Determine overall status
+    overall_status = "healthy" if db_status == lightrag_status == "healthy" else "degraded"
+    
+    return HealthCheckResponse(
+        status=overall_status,
+        timestamp=datetime.utcnow(),
+        services=ServicesStatus(
+            database=db_status,
+            lightrag=lightrag_status
+        ),
+        version="1.0.0"
+    )
+
+
 # Health check endpoint
 @app.get("/health", response_model=HealthCheckResponse)
 async def health_check():
     """
     Health check endpoint to verify system status.
     
+    Results are cached for HEALTH_CACHE_TTL seconds, and concurrent
+    requests share a single check.
+    
     Returns:
         HealthCheckResponse with system status information
     """
-    try:
-        # Check database connection
-        try:
-            # Simple database connectivity test
-            from database import SessionLocal
-            db = SessionLocal()
-            db.execute(text("SELECT 1"))
-            db.close()
-            db_status = "healthy"
-        except Exception as e:
-            logger.error(f"Database health check failed: {str(e)}")
-            db_status = "unhealthy"
-        
-        # Check LightRAG service
-        try:
-            await lightrag_service.health_check()
-            lightrag_status = "healthy"
-        except Exception as e:
-            logger.warning(f"LightRAG health check failed: {str(e)}")
-            lightrag_status = "unhealthy"
-        
-        # Determine overall status
-        overall_status = "healthy" if db_status == "healthy" else "degraded"
-        if lightrag_status == "unhealthy":
-            overall_status = "degraded"
+    if _health_cache["value"] is not None and time.monotonic() - _health_cache["t"] < HEALTH_CACHE_TTL:
+        return _health_cache["value"]
+    
+    async with _health_lock:
+        # Another request may have refreshed the result while we waited
+        if _health_cache["value"] is not None and time.monotonic() - _health_cache["t"] < HEALTH_CACHE_TTL:
+            return _health_cache["value"]
         
-        return HealthCheckResponse(
-            status=overall_status,
-            timestamp=datetime.utcnow(),
-            services={
-                "database": db_status,
-                "lightrag": lightrag_status
-            },
-            version="1.0.0"
-        )
+        result = await check_services()
+        _health_cache["value"] = result
+        _health_cache["t"] = time.monotonic()
+        return result
+
+
+# Readiness endpoint
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness endpoint for load balancers.
+    
+    Reports not ready while every database connection (including overflow)
+    is checked out, so new requests can be sent to another instance instead
+    of waiting for a connection here.
+    
+    Returns:
+        Dictionary with readiness status and connection pool usage
         
-    except Exception as e:
-        logger.error(f"Health check failed: {str(e)}")
-        return HealthCheckResponse(
-            status="unhealthy",
-            timestamp=datetime.utcnow(),
-            services={
-                "database": "unknown",
-                "lightrag": "unknown"
-            },
-            version="1.0.0"
-        )
+    Raises:
+        HTTPException: 503 if the connection pool is saturated
+    """
+    if settings.is_sqlite:
+        return {"status": "ready"}
+    
+    checked_out = engine.pool.checkedout()
+    capacity = settings.db_pool_size + settings.db_max_overflow
+    
+    if checked_out >= capacity:
+        logger.warning("Database pool saturated: %d/%d connections in use", checked_out, capacity)
+        raise service_unavailable_exception("Database connection pool is saturated")
+    
+    return {
+        "status": "ready",
+        "db_pool": {
+            "checked_out": checked_out,
+            "capacity": capacity
+        }
+    }
 
 
 # Additional utility endpoints
@@ -279,6 +382,14 @@ async def get_version():
     }
 
 
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """
+    Get LightRAG query cache statistics, to observe its hit rate.
+    """
+    return query_cache.stats()
+
+
 if __name__ == "__main__":
     import uvicorn
     
@@ -1,18 +1,75 @@
+import os
+import time
 import uuid
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey, JSON, Enum
-from sqlalchemy.dialects.postgresql import UUID
+from datetime import datetime, timezone
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, JSON, BigInteger, Integer, Index, CHAR
+from sqlalchemy.types import TypeDecorator
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
 import enum
 
 
-class MessageSender(str, enum.Enum):
+def utcnow() -> datetime:
+    """Current time in UTC, used as the client-side default for timestamp columns"""
+    return datetime.now(timezone.utc)
+
+
+def uuid7() -> uuid.UUID:
+    """
+    Generate a time-ordered UUID (version 7, RFC 9562).
+    
+    The first 48 bits are the Unix time in milliseconds, so new primary keys
+    are appended at the end of the B-tree index instead of landing on random pages.
+    
+    Returns:
+        UUID with a millisecond timestamp prefix and 74 random bits
+    """
+    timestamp_ms = time.time_ns() // 1_000_000
+    rand = int.from_bytes(os.urandom(10), "big")
+    rand_a = rand >> 68  # 12 bits
+    rand_b = rand & ((1 << 62) - 1)  # 62 bits
+    value = (
+        (timestamp_ms & ((1 << 48) - 1)) << 80
+        | 0x7 << 76  # version
+        | rand_a << 64
+        | 0b10 << 62  # variant
+        | rand_b
+    )
+    return uuid.UUID(int=value)
+
+
+class MessageSender(enum.StrEnum):
     """Enum for message sender types"""
     USER = "user"
     AI = "ai"
 
 
+class SenderType(TypeDecorator):
+    """
+    Stores MessageSender values as a single character ('u' / 'a').
+    
+    Keeps message rows narrow and avoids a native enum type, while
+    queries and results keep using MessageSender members.
+    """
+    impl = CHAR(1)
+    cache_ok = True
+
+    _TO_DB = {MessageSender.USER: "u", MessageSender.AI: "a"}
+    _FROM_DB = {code: sender for sender, code in _TO_DB.items()}
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return self._TO_DB[MessageSender(value)]
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return self._FROM_DB[value]
+
+
 class Conversation(Base):
     """
     SQLAlchemy model for storing conversation metadata.
@@ -25,7 +82,7 @@ class Conversation(Base):
     id = Column(
         UUID(as_uuid=True),
         primary_key=True,
-        default=uuid.uuid4,
+        default=uuid7,
         index=True
     )
     title = Column(
@@ -35,6 +92,7 @@ class Conversation(Base):
     )
     created_at = Column(
         DateTime(timezone=True),
+        default=utcnow,  # Set client-side so inserts need no refresh
         server_default=func.now(),
         nullable=False
     )
@@ -44,12 +102,35 @@ class Conversation(Base):
         index=True,
         comment="Optional user identifier for multi-user support in the future"
     )
+    message_count = Column(
+        Integer,
+        default=0,
+        server_default="0",
+        nullable=False,
+        comment="Number of messages in the conversation, maintained by the message CRUD operations"
+    )
+    summary = Column(
+        Text,
+        nullable=True,
+        comment="Rolling summary of older messages, sent to LightRAG instead of the raw history"
+    )
+    summarized_until = Column(
+        DateTime(timezone=True),
+        nullable=True,
+        comment="Timestamp of the last message folded into the summary"
+    )
+    summary_updated_at = Column(
+        DateTime(timezone=True),
+        nullable=True,
+        comment="When the rolling summary was last rewritten"
+    )
 
     # Relationship to messages
     messages = relationship(
         "Message",
         back_populates="conversation",
         cascade="all, delete-orphan",
+        passive_deletes=True,  # Let the ON DELETE CASCADE foreign key remove messages
         order_by="Message.timestamp"
     )
 
@@ -69,19 +150,18 @@ class Message(Base):
     id = Column(
         UUID(as_uuid=True),
         primary_key=True,
-        default=uuid.uuid4,
+        default=uuid7,
         index=True
     )
     conversation_id = Column(
         UUID(as_uuid=True),
         ForeignKey("conversations.id", ondelete="CASCADE"),
-        nullable=False,
-        index=True
+        nullable=False  # Indexed by ix_messages_conversation_timestamp_id below
     )
     sender = Column(
-        Enum(MessageSender),
+        SenderType(),
         nullable=False,
-        comment="Who sent the message: 'user' or 'ai'"
+        comment="Who sent the message: 'u' (user) or 'a' (ai)"
     )
     content = Column(
         Text,
@@ -89,19 +169,65 @@ class Message(Base):
         comment="The actual message content"
     )
     sources = Column(
-        JSON,
+        JSON().with_variant(JSONB(), "postgresql"),  # Binary JSON on PostgreSQL
         nullable=True,
         comment="JSON array of source documents for AI responses, e.g., [{'document_name': '...', 'page_number': ..., 'url': '...'}]"
     )
     timestamp = Column(
         DateTime(timezone=True),
+        default=utcnow,  # Set client-side so inserts need no refresh
         server_default=func.now(),
         nullable=False,
         index=True
     )
 
+    __table_args__ = (
+        # Serves keyset pagination of a conversation's messages, newest first
+        Index(
+            "ix_messages_conversation_timestamp_id",
+            conversation_id,
+            timestamp.desc(),
+            id.desc()
+        ),
+    )
+
     # Relationship to conversation
     conversation = relationship("Conversation", back_populates="messages")
 
     def __repr__(self):
-        return f"<Message(id={self.id}, sender={self.sender}, conversation_id={self.conversation_id}, timestamp={self.timestamp})>" 
\ No newline at end of file
+        return f"<Message(id={self.id}, sender={self.sender}, conversation_id={self.conversation_id}, timestamp={self.timestamp})>" 
+
+
+class UploadedBlob(Base):
+    """
+    SQLAlchemy model for tracking uploaded document contents.
+    
+    Each row is keyed by the SHA-256 digest of a file's content, so an upload
+    of identical bytes can be recognized and not sent to LightRAG again.
+    """
+    __tablename__ = "uploaded_blobs"
+
+    sha256 = Column(
+        String(64),
+        primary_key=True,
+        comment="Hex SHA-256 digest of the file content"
+    )
+    filename = Column(
+        String(255),
+        nullable=False,
+        comment="Stored filename of the first upload with this content"
+    )
+    size = Column(
+        BigInteger,
+        nullable=False,
+        comment="File size in bytes"
+    )
+    created_at = Column(
+        DateTime(timezone=True),
+        default=utcnow,  # Set client-side so inserts need no refresh
+        server_default=func.now(),
+        nullable=False
+    )
+
+    def __repr__(self):
+        return f"<UploadedBlob(sha256={self.sha256}, filename='{self.filename}', size={self.size})>"
\ No newline at end of file
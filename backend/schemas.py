@@ -1,11 +1,11 @@
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from uuid import UUID
-from enum import Enum
+from enum import StrEnum
 
 
-class MessageSenderEnum(str, Enum):
+class MessageSenderEnum(StrEnum):
     """Enum for message sender types"""
     USER = "user"
     AI = "ai"
@@ -14,10 +14,9 @@ class MessageSenderEnum(str, Enum):
 # Base schemas for common fields
 class TimestampMixin(BaseModel):
     """Mixin for models with timestamp fields"""
-    created_at: datetime
+    model_config = ConfigDict(from_attributes=True)
     
-    class Config:
-        from_attributes= True
+    created_at: datetime
 
 
 # === CONVERSATION SCHEMAS ===
@@ -30,26 +29,24 @@ class ConversationCreate(BaseModel):
 
 class ConversationResponse(BaseModel):
     """Schema for conversation response"""
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+    
     id: UUID = Field(..., description="Unique conversation identifier")
     title: Optional[str] = Field(None, description="Conversation title")
     created_at: datetime = Field(..., description="When the conversation was created")
     user_id: Optional[str] = Field(None, description="User identifier")
     message_count: Optional[int] = Field(None, description="Number of messages in conversation")
-    
-    class Config:
-        from_attributes= True
 
 
 class ConversationSummary(BaseModel):
     """Schema for conversation list item (summary view)"""
+    model_config = ConfigDict(from_attributes=True)
+    
     id: UUID
     title: Optional[str]
     created_at: datetime
     last_message_at: Optional[datetime] = None
     message_count: int = 0
-    
-    class Config:
-        from_attributes= True
 
 
 # === MESSAGE SCHEMAS ===
@@ -59,20 +56,19 @@ class MessageCreate(BaseModel):
     conversation_id: UUID = Field(..., description="ID of the conversation this message belongs to")
     sender: MessageSenderEnum = Field(..., description="Who sent the message")
     content: str = Field(..., min_length=1, description="Message content")
-    sources: Optional[List[Dict[str, Any]]] = Field(None, description="Source documents for AI responses")
+    sources: Optional[Any] = Field(None, description="Source documents for AI responses, passed through as returned by LightRAG")
 
 
 class MessageResponse(BaseModel):
     """Schema for message response"""
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+    
     id: UUID = Field(..., description="Unique message identifier")
     conversation_id: UUID = Field(..., description="Conversation ID")
     sender: MessageSenderEnum = Field(..., description="Message sender")
     content: str = Field(..., description="Message content")
-    sources: Optional[List[Dict[str, Any]]] = Field(None, description="Source documents")
+    sources: Optional[Any] = Field(None, description="Source documents, passed through as stored")
     timestamp: datetime = Field(..., description="When the message was sent")
-    
-    class Config:
-        from_attributes= True
 
 
 # === CHAT SCHEMAS ===
@@ -82,8 +78,9 @@ class ChatRequest(BaseModel):
     conversation_id: Optional[UUID] = Field(None, description="Existing conversation ID, or None to create new")
     message: str = Field(..., min_length=1, max_length=10000, description="User's message")
     
-    @validator('message')
-    def validate_message(cls, v):
+    @field_validator('message')
+    @classmethod
+    def validate_message(cls, v: str) -> str:
         if not v.strip():
             raise ValueError('Message cannot be empty or just whitespace')
         return v.strip()
@@ -91,9 +88,11 @@ class ChatRequest(BaseModel):
 
 class ChatResponse(BaseModel):
     """Schema for chat endpoint response"""
+    model_config = ConfigDict(frozen=True)
+    
     conversation_id: UUID = Field(..., description="Conversation ID (new or existing)")
     ai_message: str = Field(..., description="AI's response")
-    sources: Optional[List[Dict[str, Any]]] = Field(None, description="Source documents used for the response")
+    sources: Optional[Any] = Field(None, description="Source documents used for the response, passed through as returned by LightRAG")
     user_message_id: UUID = Field(..., description="ID of the user's message")
     ai_message_id: UUID = Field(..., description="ID of the AI's message")
 
@@ -126,7 +125,7 @@ class LightRAGQueryRequest(BaseModel):
     max_token_for_text_unit: Optional[int] = Field(None, gt=1, description="Max tokens per text unit")
     max_token_for_global_context: Optional[int] = Field(None, gt=1, description="Max tokens for global context")
     max_token_for_local_context: Optional[int] = Field(None, gt=1, description="Max tokens for local context")
-    conversation_history: Optional[List[Dict[str, Any]]] = Field(None, description="Conversation history")
+    conversation_history: Optional[Any] = Field(None, description="Conversation history, passed through to LightRAG")
     history_turns: Optional[int] = Field(None, ge=0, description="Number of history turns")
     ids: Optional[List[str]] = Field(None, description="List of IDs to filter results")
     user_prompt: Optional[str] = Field(None, description="User-provided prompt")
@@ -134,11 +133,15 @@ class LightRAGQueryRequest(BaseModel):
 
 class LightRAGQueryResponse(BaseModel):
     """Schema for LightRAG query response"""
-    response: str = Field(..., description="The generated response")
+    model_config = ConfigDict(frozen=True)
+    
+    response: str = Field("", description="The generated response")
 
 
 class LightRAGUploadResponse(BaseModel):
     """Schema for LightRAG upload response"""
+    model_config = ConfigDict(frozen=True)
+    
     status: str = Field(..., description="Upload status")
     message: str = Field(..., description="Status message")
 
@@ -147,6 +150,8 @@ class LightRAGUploadResponse(BaseModel):
 
 class ErrorResponse(BaseModel):
     """Schema for error responses"""
+    model_config = ConfigDict(frozen=True)
+    
     error: str = Field(..., description="Error message")
     detail: Optional[str] = Field(None, description="Additional error details")
     status_code: int = Field(..., description="HTTP status code")
@@ -154,15 +159,27 @@ class ErrorResponse(BaseModel):
 
 class SuccessResponse(BaseModel):
     """Schema for simple success responses"""
+    model_config = ConfigDict(frozen=True)
+    
     success: bool = Field(True, description="Operation success status")
     message: str = Field(..., description="Success message")
 
 
 # === HEALTH CHECK SCHEMA ===
 
+class ServicesStatus(BaseModel):
+    """Schema for the status of dependent services"""
+    model_config = ConfigDict(extra="ignore")
+    
+    database: str = Field(..., description="Database status")
+    lightrag: str = Field(..., description="LightRAG server status")
+
+
 class HealthCheckResponse(BaseModel):
     """Schema for health check response"""
+    model_config = ConfigDict(frozen=True)
+    
     status: str = Field(..., description="Service status")
     timestamp: datetime = Field(..., description="Check timestamp")
-    services: Dict[str, str] = Field(..., description="Status of dependent services")
+    services: ServicesStatus = Field(..., description="Status of dependent services")
     version: str = Field(..., description="API version") 
\ No newline at end of file
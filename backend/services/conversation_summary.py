@@ -0,0 +1,93 @@
+import logging
+from typing import Set
+from uuid import UUID
+from database import SessionLocal
+from services.lightrag import lightrag_service
+import crud
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Number of most recent messages that are always sent verbatim
+KEEP_RECENT_MESSAGES = 4
+
+# Rewrite the summary once this many chat turns (user + AI message) beyond
+# KEEP_RECENT_MESSAGES have piled up, so it stays unchanged in between
+SUMMARY_EVERY_TURNS = 3
+SUMMARY_TRIGGER_MARGIN = 2 * SUMMARY_EVERY_TURNS
+
+# Unsummarized messages at which older ones are folded into the summary;
+# queries always include every unsummarized message, so this bounds the usual
+# history size, but nothing is dropped while a fold is pending or has failed
+MAX_UNSUMMARIZED_MESSAGES = KEEP_RECENT_MESSAGES + SUMMARY_TRIGGER_MARGIN
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a user and an assistant.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}
+
+Write the updated summary in the language of the conversation, in at most 200 words. Keep the questions, facts and answers that later messages may refer to. Reply with the summary only."""
+
+# Conversations with a summarization currently in progress
+_in_progress: Set[UUID] = set()
+
+
+async def summarize_conversation(conversation_id: UUID) -> None:
+    """
+    Fold older messages of a conversation into its rolling summary.
+
+    Meant to run as a background task after a chat turn. Once
+    MAX_UNSUMMARIZED_MESSAGES messages are not yet part of the summary,
+    all but the most recent KEEP_RECENT_MESSAGES are folded
+    into it using LightRAG's bypass mode (plain LLM call, no retrieval).
+
+    Args:
+        conversation_id: UUID of the conversation
+    """
+    if conversation_id in _in_progress:
+        return
+
+    _in_progress.add(conversation_id)
+    try:
+        # Sessions are kept short, so no pooled connection is held while
+        # waiting for the LLM call
+        async with SessionLocal() as db:
+            conversation = await crud.get_conversation(db, conversation_id)
+            if not conversation:
+                return
+
+            messages = await crud.get_unsummarized_messages(db, conversation)
+
+        if len(messages) < MAX_UNSUMMARIZED_MESSAGES:
+            return
+
+        to_fold = messages[:-KEEP_RECENT_MESSAGES]
+        prompt = SUMMARY_PROMPT.format(
+            summary=conversation.summary or "(none)",
+            messages="\n".join(
+                f"{crud._ROLE[message.sender]}: {message.content}"
+                for message in to_fold
+            )
+        )
+
+        result = await lightrag_service.query(query=prompt, mode="bypass")
+        summary = result.response.strip()
+        if not summary:
+            return
+
+        async with SessionLocal() as db:
+            await crud.update_conversation_summary(
+                db=db,
+                conversation_id=conversation_id,
+                summary=summary,
+                summarized_until=to_fold[-1].timestamp
+            )
+        logger.info("Updated summary for conversation %s (%d messages folded)", conversation_id, len(to_fold))
+
+    except Exception as e:
+        logger.warning("Failed to summarize conversation %s: %s", conversation_id, e)
+    finally:
+        _in_progress.discard(conversation_id)
@@ -1,13 +1,53 @@
+import functools
 import httpx
 import logging
-from typing import Optional, List, Dict, Any, BinaryIO
+from typing import Optional, List, Dict, Any, BinaryIO, Callable, Final, TypeVar, Union
 from config import settings
 from schemas import LightRAGQueryRequest, LightRAGQueryResponse, LightRAGUploadResponse
-import json
+import orjson
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+F = TypeVar("F", bound=Callable[..., Any])
+
+# Instructions appended to every query so answers end with linked references
+_USER_PROMPT: Final[str] = """
+At the end of the response, always include a section titled exactly "References", regardless of the language of the main response. Do not translate or change this heading. It must always appear as "References" in English.
+
+Format each reference in **Markdown link format**, using the following structure:
+[KG/DC/KG+DC] [file_name](http://localhost:8000/api/documents/file_name)
+
+Example:
+[DC] [Rapor (1)_3816aba6.pdf](http://localhost:8000/api/documents/Rapor%20%281%29_3816aba6.pdf)
+
+"""
+
+
+def _lightrag_call(operation: str) -> Callable[[F], F]:
+    """
+    Decorator that logs failed LightRAG requests and re-raises the error.
+    
+    Args:
+        operation: Description of the operation used in log messages
+        
+    Returns:
+        Decorator for LightRAGService methods
+    """
+    def decorator(func: F) -> F:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            try:
+                return await func(*args, **kwargs)
+            except httpx.HTTPError as e:
+                logger.error("%s failed: %s", operation, e)
+                raise
+            except Exception as e:
+                logger.error("Unexpected error during %s: %s", operation, e)
+                raise
+        return wrapper
+    return decorator
+
 
 class LightRAGService:
     """
@@ -17,44 +57,65 @@ class LightRAGService:
     including queries, document uploads, and other operations.
     """
     
+    # Endpoint paths, resolved against the client's base URL
+    _QUERY_PATH = "/query"
+    _UPLOAD_PATH = "/documents/upload"
+    _TEXT_PATH = "/documents/text"
+    _SCAN_PATH = "/documents/scan"
+    _PIPELINE_STATUS_PATH = "/documents/pipeline_status"
+    _HEALTH_PATH = "/health"
+    
+    # Short timeouts for status probes, so a stalled server fails them fast
+    _HEALTH_TIMEOUT = httpx.Timeout(connect=2.0, read=5.0, write=5.0, pool=2.0)
+    _PIPELINE_STATUS_TIMEOUT = httpx.Timeout(connect=2.0, read=15.0, write=5.0, pool=2.0)
+    
+    # Extra headers for requests with a JSON body
+    _JSON_HEADERS = {"Content-Type": "application/json"}
+    
     def __init__(self):
         self.base_url = settings.lightrag_server_url.rstrip('/')
         self.api_key = settings.lightrag_api_key
         self.timeout = 300.0  # 5 minutes timeout for long operations
         
-    def _get_headers(self) -> Dict[str, str]:
+        # Headers sent with every request, set once as client defaults; LightRAG
+        # reads the API key from X-API-Key (a Bearer token must be a login JWT)
+        self._default_headers = {"Accept": "application/json"}
+        if self.api_key:
+            self._default_headers["X-API-Key"] = self.api_key
+        
+        # Shared client so connections to LightRAG are kept alive and reused
+        self._client: Optional[httpx.AsyncClient] = None
+    
+    def _get_client(self) -> httpx.AsyncClient:
         """
-        Get HTTP headers for LightRAG API requests.
+        Get the shared HTTP client, creating it on first use or after it was closed.
         
         Returns:
-            Dictionary of HTTP headers
+            Pooled httpx.AsyncClient
         """
-        headers = {
-            "Content-Type": "application/json",
-            "Accept": "application/json"
-        }
-        
-        if self.api_key:
-            headers["Authorization"] = f"Bearer {self.api_key}"
-            
-        return headers
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self._default_headers,
+                http2=True,
+                limits=httpx.Limits(
+                    max_keepalive_connections=32,
+                    max_connections=64,
+                    keepalive_expiry=60.0  # seconds an idle connection is kept open
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=2.0)
+            )
+        return self._client
     
-    def _get_upload_headers(self) -> Dict[str, str]:
+    async def aclose(self) -> None:
         """
-        Get HTTP headers for file upload requests.
-        
-        Returns:
-            Dictionary of HTTP headers for file uploads
+        Close the shared HTTP client and its pooled connections.
         """
-        headers = {
-            "Accept": "application/json"
-        }
-        
-        if self.api_key:
-            headers["Authorization"] = f"Bearer {self.api_key}"
-            
-        return headers
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
     
+    @_lightrag_call("LightRAG query")
     async def query(
         self, 
         query: str,
@@ -78,22 +139,11 @@ class LightRAGService:
             httpx.HTTPError: If the request fails
             ValueError: If the response is invalid
         """
-        url = f"{self.base_url}/query"
-        
         # Build the request payload
         payload = {
             "query": query,
             "mode": mode,
-            "user_prompt": """
-At the end of the response, always include a section titled exactly "References", regardless of the language of the main response. Do not translate or change this heading. It must always appear as "References" in English.
-
-Format each reference in **Markdown link format**, using the following structure:
-[KG/DC/KG+DC] [file_name](http://localhost:8000/api/documents/file_name)
-
-Example:
-[DC] [Rapor (1)_3816aba6.pdf](http://localhost:8000/api/documents/Rapor%20%281%29_3816aba6.pdf)
-
-"""
+            "user_prompt": _USER_PROMPT
         }
         
         if conversation_history:
@@ -104,45 +154,32 @@ Example:
             if value is not None:
                 payload[key] = value
         
-        try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                logger.info(f"Sending query to LightRAG: {query[:100]}...")
-                
-                # Add API key as query parameter if available
-                params = {}
-                if self.api_key:
-                    params["api_key_header_value"] = self.api_key
-                
-                response = await client.post(
-                    url,
-                    json=payload,
-                    headers=self._get_headers(),
-                    params=params
-                )
-                response.raise_for_status()
-                
-                result = response.json()
-                logger.info("Query completed successfully")
-                
-                return LightRAGQueryResponse(response=result.get("response", ""))
-                
-        except httpx.HTTPError as e:
-            logger.error(f"LightRAG query failed: {str(e)}")
-            raise
-        except Exception as e:
-            logger.error(f"Unexpected error during LightRAG query: {str(e)}")
-            raise
+        logger.info("Sending query to LightRAG: %.100s...", query)
+        
+        response = await self._get_client().post(
+            self._QUERY_PATH,
+            content=orjson.dumps(payload),
+            headers=self._JSON_HEADERS
+        )
+        response.raise_for_status()
+        
+        # Validate the JSON bytes directly instead of parsing to a dict first
+        result = LightRAGQueryResponse.model_validate_json(response.content)
+        logger.info("Query completed successfully")
+        
+        return result
     
+    @_lightrag_call("document upload")
     async def upload_document(
         self, 
-        file_content: bytes, 
+        file_stream: Union[bytes, BinaryIO], 
         filename: str
     ) -> LightRAGUploadResponse:
         """
         Upload a document to LightRAG server.
         
         Args:
-            file_content: The file content as bytes
+            file_stream: An open binary file, which is streamed in chunks, or the file content as bytes
             filename: Name of the file
             
         Returns:
@@ -151,45 +188,29 @@ Example:
         Raises:
             httpx.HTTPError: If the upload fails
         """
-        url = f"{self.base_url}/documents/upload"
+        logger.info("Uploading document to LightRAG: %s", filename)
+        
+        # Prepare the file for upload; httpx reads a file object in chunks and
+        # sets Content-Length from its size, so the body is not chunk-encoded
+        files = {
+            "file": (filename, file_stream, "application/octet-stream")
+        }
         
-        try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                logger.info(f"Uploading document to LightRAG: {filename}")
-                
-                # Prepare the file for upload
-                files = {
-                    "file": (filename, file_content, "application/octet-stream")
-                }
-                
-                # Add API key as query parameter if available
-                params = {}
-                if self.api_key:
-                    params["api_key_header_value"] = self.api_key
-                
-                response = await client.post(
-                    url,
-                    files=files,
-                    headers=self._get_upload_headers(),
-                    params=params
-                )
-                response.raise_for_status()
-                
-                result = response.json()
-                logger.info(f"Document upload completed: {filename}")
-                
-                return LightRAGUploadResponse(
-                    status=result.get("status", "success"),
-                    message=result.get("message", "Upload completed")
-                )
-                
-        except httpx.HTTPError as e:
-            logger.error(f"Document upload failed: {str(e)}")
-            raise
-        except Exception as e:
-            logger.error(f"Unexpected error during document upload: {str(e)}")
-            raise
+        response = await self._get_client().post(
+            self._UPLOAD_PATH,
+            files=files
+        )
+        response.raise_for_status()
+        
+        result = orjson.loads(response.content)
+        logger.info("Document upload completed: %s", filename)
+        
+        return LightRAGUploadResponse(
+            status=result.get("status", "success"),
+            message=result.get("message", "Upload completed")
+        )
     
+    @_lightrag_call("text insertion")
     async def insert_text(
         self, 
         text: str, 
@@ -208,44 +229,27 @@ Example:
         Raises:
             httpx.HTTPError: If the request fails
         """
-        url = f"{self.base_url}/documents/text"
+        # orjson writes the (possibly large) text as raw UTF-8 in a single pass
+        body = orjson.dumps({"text": text, "file_source": file_source} if file_source else {"text": text})
+        
+        logger.info("Inserting text to LightRAG: %d characters", len(text))
         
-        payload = {"text": text}
-        if file_source:
-            payload["file_source"] = file_source
+        response = await self._get_client().post(
+            self._TEXT_PATH,
+            content=body,
+            headers=self._JSON_HEADERS
+        )
+        response.raise_for_status()
         
-        try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                logger.info(f"Inserting text to LightRAG: {len(text)} characters")
-                
-                # Add API key as query parameter if available
-                params = {}
-                if self.api_key:
-                    params["api_key_header_value"] = self.api_key
-                
-                response = await client.post(
-                    url,
-                    json=payload,
-                    headers=self._get_headers(),
-                    params=params
-                )
-                response.raise_for_status()
-                
-                result = response.json()
-                logger.info("Text insertion completed")
-                
-                return LightRAGUploadResponse(
-                    status=result.get("status", "success"),
-                    message=result.get("message", "Text inserted successfully")
-                )
-                
-        except httpx.HTTPError as e:
-            logger.error(f"Text insertion failed: {str(e)}")
-            raise
-        except Exception as e:
-            logger.error(f"Unexpected error during text insertion: {str(e)}")
-            raise
+        result = orjson.loads(response.content)
+        logger.info("Text insertion completed")
+        
+        return LightRAGUploadResponse(
+            status=result.get("status", "success"),
+            message=result.get("message", "Text inserted successfully")
+        )
     
+    @_lightrag_call("document scan")
     async def scan_documents(self) -> Dict[str, Any]:
         """
         Trigger document scanning on LightRAG server.
@@ -256,36 +260,20 @@ Example:
         Raises:
             httpx.HTTPError: If the request fails
         """
-        url = f"{self.base_url}/documents/scan"
+        logger.info("Triggering document scan on LightRAG")
+        
+        response = await self._get_client().post(
+            self._SCAN_PATH,
+            headers=self._JSON_HEADERS
+        )
+        response.raise_for_status()
+        
+        result = orjson.loads(response.content)
+        logger.info("Document scan triggered successfully")
         
-        try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                logger.info("Triggering document scan on LightRAG")
-                
-                # Add API key as query parameter if available
-                params = {}
-                if self.api_key:
-                    params["api_key_header_value"] = self.api_key
-                
-                response = await client.post(
-                    url,
-                    headers=self._get_headers(),
-                    params=params
-                )
-                response.raise_for_status()
-                
-                result = response.json()
-                logger.info("Document scan triggered successfully")
-                
-                return result
-                
-        except httpx.HTTPError as e:
-            logger.error(f"Document scan failed: {str(e)}")
-            raise
-        except Exception as e:
-            logger.error(f"Unexpected error during document scan: {str(e)}")
-            raise
+        return result
     
+    @_lightrag_call("pipeline status request")
     async def get_pipeline_status(self) -> Dict[str, Any]:
         """
         Get the current pipeline status from LightRAG server.
@@ -296,31 +284,15 @@ Example:
         Raises:
             httpx.HTTPError: If the request fails
         """
-        url = f"{self.base_url}/documents/pipeline_status"
+        response = await self._get_client().get(
+            self._PIPELINE_STATUS_PATH,
+            timeout=self._PIPELINE_STATUS_TIMEOUT
+        )
+        response.raise_for_status()
         
-        try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                # Add API key as query parameter if available
-                params = {}
-                if self.api_key:
-                    params["api_key_header_value"] = self.api_key
-                
-                response = await client.get(
-                    url,
-                    headers=self._get_headers(),
-                    params=params
-                )
-                response.raise_for_status()
-                
-                return response.json()
-                
-        except httpx.HTTPError as e:
-            logger.error(f"Pipeline status request failed: {str(e)}")
-            raise
-        except Exception as e:
-            logger.error(f"Unexpected error getting pipeline status: {str(e)}")
-            raise
+        return orjson.loads(response.content)
     
+    @_lightrag_call("LightRAG health check")
     async def health_check(self) -> Dict[str, Any]:
         """
         Check if LightRAG server is healthy.
@@ -331,30 +303,13 @@ Example:
         Raises:
             httpx.HTTPError: If the health check fails
         """
-        url = f"{self.base_url}/health"
+        response = await self._get_client().get(
+            self._HEALTH_PATH,
+            timeout=self._HEALTH_TIMEOUT
+        )
+        response.raise_for_status()
         
-        try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                # Add API key as query parameter if available
-                params = {}
-                if self.api_key:
-                    params["api_key_header_value"] = self.api_key
-                
-                response = await client.get(
-                    url,
-                    headers=self._get_headers(),
-                    params=params
-                )
-                response.raise_for_status()
-                
-                return response.json()
-                
-        except httpx.HTTPError as e:
-            logger.error(f"LightRAG health check failed: {str(e)}")
-            raise
-        except Exception as e:
-            logger.error(f"Unexpected error during health check: {str(e)}")
-            raise
+        return orjson.loads(response.content)
 
 
 # Global service instance
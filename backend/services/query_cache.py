@@ -0,0 +1,281 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional, List, Dict, Any, Set, Tuple
+from config import settings
+from schemas import LightRAGQueryResponse
+from services.lightrag import lightrag_service
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Seconds between LightRAG pipeline status polls while documents are indexed
+INDEXING_POLL_INTERVAL = 2.0
+
+# Seconds to wait for the pipeline to pick up a queued document
+INDEXING_START_TIMEOUT = 60.0
+
+# Seconds after which caching is resumed even if the pipeline is still busy
+INDEXING_MAX_WAIT = 1800.0
+
+
+class QueryCache:
+    """
+    In-process LRU cache for LightRAG query responses.
+
+    Entries are keyed on the normalized query text, the query options and a
+    digest of the conversation history, so a cached answer is only reused
+    when LightRAG would receive an equivalent request. Entries expire after
+    a TTL, and the whole cache is invalidated when the document corpus
+    changes (upload or scan). LightRAG indexes new documents in the
+    background, so nothing is cached until its pipeline has finished, and
+    the cache is invalidated again at that point.
+
+    The cache lives in the worker process; with several workers each one
+    keeps its own entries and the TTL bounds how stale they can get.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._corpus_version = 0
+        self._indexing = 0
+        self._entries: "OrderedDict[str, Tuple[float, LightRAGQueryResponse]]" = OrderedDict()
+
+    def _make_key(
+        self,
+        query: str,
+        mode: str,
+        top_k: Optional[int],
+        conversation_history: Optional[List[Dict[str, str]]]
+    ) -> str:
+        """
+        Build the cache key for a query.
+
+        Args:
+            query: The query text
+            mode: Query mode
+            top_k: Number of top items to retrieve
+            conversation_history: Conversation history sent with the query
+
+        Returns:
+            Cache key string
+        """
+        normalized_query = " ".join(query.casefold().split())
+
+        hasher = hashlib.sha256()
+        for message in conversation_history or ():
+            hasher.update(message["role"].encode())
+            hasher.update(b"\x1e")
+            hasher.update(message["content"].encode())
+            hasher.update(b"\x1f")
+
+        return f"{self._corpus_version}:{mode}:{top_k}:{hasher.hexdigest()}:{normalized_query}"
+
+    def get(
+        self,
+        query: str,
+        mode: str,
+        top_k: Optional[int] = None,
+        conversation_history: Optional[List[Dict[str, str]]] = None
+    ) -> Optional[LightRAGQueryResponse]:
+        """
+        Look up a cached LightRAG response.
+
+        Args:
+            query: The query text
+            mode: Query mode
+            top_k: Number of top items to retrieve
+            conversation_history: Conversation history sent with the query
+
+        Returns:
+            Cached LightRAGQueryResponse or None on a miss
+        """
+        if self.max_entries <= 0:
+            return None
+
+        key = self._make_key(query, mode, top_k, conversation_history)
+        entry = self._entries.get(key)
+
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(
+        self,
+        query: str,
+        mode: str,
+        response: LightRAGQueryResponse,
+        top_k: Optional[int] = None,
+        conversation_history: Optional[List[Dict[str, str]]] = None
+    ) -> None:
+        """
+        Store a LightRAG response in the cache.
+
+        Args:
+            query: The query text
+            mode: Query mode
+            response: LightRAG response to cache
+            top_k: Number of top items to retrieve
+            conversation_history: Conversation history sent with the query
+        """
+        if self.max_entries <= 0 or self._indexing or not response.response:
+            return
+
+        key = self._make_key(query, mode, top_k, conversation_history)
+        self._entries[key] = (time.monotonic(), response)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self) -> None:
+        """
+        Drop all cached responses after the document corpus has changed.
+        """
+        self._corpus_version += 1
+        self._entries.clear()
+        logger.info("Query cache invalidated (corpus version %d)", self._corpus_version)
+    
+    def begin_indexing(self) -> None:
+        """
+        Invalidate the cache and stop caching while LightRAG indexes a corpus change.
+        """
+        self._indexing += 1
+        self.invalidate()
+    
+    def end_indexing(self) -> None:
+        """
+        Invalidate answers given during indexing and resume caching once no indexing is pending.
+        """
+        self._indexing = max(self._indexing - 1, 0)
+        self.invalidate()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache statistics.
+
+        Returns:
+            Dictionary with entry count, hit and miss counters and hit rate
+        """
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "corpus_version": self._corpus_version,
+            "indexing": self._indexing > 0
+        }
+
+
+# Global cache instance
+query_cache = QueryCache(
+    max_entries=settings.query_cache_max_entries,
+    ttl=settings.query_cache_ttl
+)
+
+
+# Running wait_for_indexing tasks, cancelled at application shutdown
+_indexing_tasks: Set["asyncio.Task[None]"] = set()
+
+
+def _parse_job_start(value: Any) -> Optional[datetime]:
+    """
+    Parse the job_start of a LightRAG pipeline status.
+    
+    LightRAG writes some job start times without a timezone; those are
+    taken as UTC.
+    
+    Args:
+        value: job_start value from the pipeline status
+        
+    Returns:
+        Timezone-aware datetime, or None if missing or unparsable
+    """
+    try:
+        job_start = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if job_start.tzinfo is None:
+        job_start = job_start.replace(tzinfo=timezone.utc)
+    return job_start
+
+
+async def wait_for_indexing(started_at: datetime) -> None:
+    """
+    Keep the query cache paused until LightRAG has indexed a corpus change.
+    
+    Started with watch_indexing after a document upload or scan.
+    Indexing is taken as finished once the pipeline is idle after having
+    been busy or after starting a job at or after started_at. If no job
+    starts within INDEXING_START_TIMEOUT, or indexing takes longer than
+    INDEXING_MAX_WAIT, caching is resumed anyway.
+    
+    Args:
+        started_at: When the documents were handed to LightRAG (timezone-aware)
+    """
+    query_cache.begin_indexing()
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    seen_job = False
+    
+    try:
+        while loop.time() - start < INDEXING_MAX_WAIT:
+            await asyncio.sleep(INDEXING_POLL_INTERVAL)
+            
+            try:
+                pipeline_status = await lightrag_service.get_pipeline_status()
+            except Exception:
+                continue
+            
+            job_start = _parse_job_start(pipeline_status.get("job_start"))
+            if pipeline_status.get("busy") or (job_start is not None and job_start >= started_at):
+                seen_job = True
+            
+            if not pipeline_status.get("busy"):
+                if seen_job:
+                    logger.info("LightRAG pipeline finished indexing")
+                    return
+                if loop.time() - start >= INDEXING_START_TIMEOUT:
+                    logger.warning("LightRAG pipeline did not start indexing, resuming query cache")
+                    return
+        
+        logger.warning("LightRAG pipeline still busy after %.0f seconds, resuming query cache", INDEXING_MAX_WAIT)
+    finally:
+        query_cache.end_indexing()
+
+
+def watch_indexing(started_at: datetime) -> None:
+    """
+    Start wait_for_indexing as a task owned by the application.
+    
+    It is not run as a request background task, because the server would
+    wait for it (up to INDEXING_MAX_WAIT) on shutdown or reload.
+    
+    Args:
+        started_at: When the documents were handed to LightRAG (timezone-aware)
+    """
+    task = asyncio.create_task(wait_for_indexing(started_at))
+    _indexing_tasks.add(task)
+    task.add_done_callback(_indexing_tasks.discard)
+
+
+async def cancel_indexing_watches() -> None:
+    """
+    Cancel running wait_for_indexing tasks at application shutdown.
+    """
+    for task in _indexing_tasks:
+        task.cancel()
+    await asyncio.gather(*_indexing_tasks, return_exceptions=True)
\ No newline at end of file
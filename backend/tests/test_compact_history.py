@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import crud
+from schemas import ConversationCreate
+from services.conversation_summary import MAX_UNSUMMARIZED_MESSAGES
+
+
+async def _create_turns(db, conversation_id, count):
+    """Save `count` chat turns with increasing timestamps and return their messages in order."""
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    messages = []
+    for i in range(count):
+        messages.extend(await crud.create_turn(
+            db,
+            conversation_id,
+            user_content=f"question {i}",
+            ai_content=f"answer {i}",
+            user_timestamp=start + timedelta(minutes=2 * i),
+            ai_timestamp=start + timedelta(minutes=2 * i + 1)
+        ))
+    return messages
+
+
+@pytest.mark.asyncio
+async def test_compact_history_keeps_messages_past_the_fold_threshold(db):
+    """A fold that is still running (or failed) must not drop any message from the history."""
+    conversation = await crud.create_conversation(db, ConversationCreate())
+    turns = MAX_UNSUMMARIZED_MESSAGES // 2 + 1
+    messages = await _create_turns(db, conversation.id, turns)
+    assert len(messages) > MAX_UNSUMMARIZED_MESSAGES
+    
+    history = await crud.get_compact_history(db, conversation)
+    
+    assert [entry["content"] for entry in history] == [message.content for message in messages]
+    assert [entry["role"] for entry in history] == ["user", "assistant"] * turns
+
+
+@pytest.mark.asyncio
+async def test_compact_history_continues_right_after_the_summary(db):
+    """Every message after summarized_until follows the summary, with no gap in between."""
+    conversation = await crud.create_conversation(db, ConversationCreate())
+    messages = await _create_turns(db, conversation.id, MAX_UNSUMMARIZED_MESSAGES)
+    
+    folded = messages[:4]
+    await crud.update_conversation_summary(
+        db=db,
+        conversation_id=conversation.id,
+        summary="earlier turns",
+        summarized_until=folded[-1].timestamp
+    )
+    conversation = await crud.get_conversation(db, conversation.id)
+    
+    history = await crud.get_compact_history(db, conversation)
+    
+    assert history[:2] == [
+        {"role": "user", "content": "Summarize our conversation so far."},
+        {"role": "assistant", "content": "earlier turns"}
+    ]
+    assert [entry["content"] for entry in history[2:]] == [message.content for message in messages[4:]]
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import crud
+from schemas import ConversationCreate, LightRAGQueryResponse
+from services import conversation_summary
+
+
+@pytest.mark.asyncio
+async def test_summary_is_folded_every_few_turns(db, monkeypatch):
+    """The first fold happens 3 turns past the kept messages, then again every 3 turns."""
+    folds = []
+    
+    async def fake_query(query, mode="hybrid", **kwargs):
+        folds.append(turn)
+        return LightRAGQueryResponse(response=f"summary after turn {turn}")
+    
+    monkeypatch.setattr(conversation_summary.lightrag_service, "query", fake_query)
+    monkeypatch.setattr(
+        conversation_summary,
+        "SessionLocal",
+        async_sessionmaker(db.bind, expire_on_commit=False)
+    )
+    
+    conversation = await crud.create_conversation(db, ConversationCreate())
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    for turn in range(1, 12):
+        await crud.create_turn(
+            db,
+            conversation.id,
+            user_content=f"question {turn}",
+            ai_content=f"answer {turn}",
+            user_timestamp=start + timedelta(minutes=2 * turn),
+            ai_timestamp=start + timedelta(minutes=2 * turn + 1)
+        )
+        await conversation_summary.summarize_conversation(conversation.id)
+    
+    assert folds == [5, 8, 11]
+    
+    conversation = await crud.get_conversation(db, conversation.id)
+    unsummarized = await crud.get_unsummarized_messages(db, conversation)
+    assert conversation.summary == "summary after turn 11"
+    assert len(unsummarized) == conversation_summary.KEEP_RECENT_MESSAGES
@@ -0,0 +1,92 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+from schemas import LightRAGQueryResponse
+from services import query_cache as query_cache_module
+from services.query_cache import (
+    QueryCache,
+    cancel_indexing_watches,
+    query_cache,
+    wait_for_indexing,
+    watch_indexing
+)
+
+
+def test_set_is_skipped_while_indexing():
+    cache = QueryCache(max_entries=8, ttl=60)
+    response = LightRAGQueryResponse(response="answer")
+    
+    cache.begin_indexing()
+    cache.set("question", "hybrid", response)
+    assert cache.get("question", "hybrid") is None
+    
+    cache.end_indexing()
+    cache.set("question", "hybrid", response)
+    assert cache.get("question", "hybrid") is response
+    assert cache.stats()["hit_rate"] == 0.5
+
+
+@pytest.mark.asyncio
+async def test_caching_resumes_only_after_the_pipeline_finishes(monkeypatch):
+    started_at = datetime.now(timezone.utc)
+    statuses = iter([
+        {"busy": False, "job_start": None},  # document not picked up yet
+        {"busy": True, "job_start": started_at.isoformat()},
+        {"busy": False, "job_start": started_at.isoformat()}
+    ])
+    indexing_flags = []
+    
+    async def get_pipeline_status():
+        status = next(statuses)
+        indexing_flags.append(query_cache.stats()["indexing"])
+        return status
+    
+    monkeypatch.setattr(query_cache_module, "INDEXING_POLL_INTERVAL", 0)
+    monkeypatch.setattr(query_cache_module.lightrag_service, "get_pipeline_status", get_pipeline_status)
+    version = query_cache.stats()["corpus_version"]
+    
+    await wait_for_indexing(started_at)
+    
+    assert indexing_flags == [True, True, True]
+    assert query_cache.stats()["indexing"] is False
+    # Invalidated when indexing starts and again once it has finished
+    assert query_cache.stats()["corpus_version"] == version + 2
+
+
+@pytest.mark.asyncio
+async def test_naive_job_start_is_taken_as_utc(monkeypatch):
+    started_at = datetime.now(timezone.utc)
+    statuses = iter([
+        {"busy": False, "job_start": "not a date"},
+        {"busy": False, "job_start": started_at.replace(tzinfo=None).isoformat()}
+    ])
+    
+    async def get_pipeline_status():
+        return next(statuses)
+    
+    monkeypatch.setattr(query_cache_module, "INDEXING_POLL_INTERVAL", 0)
+    monkeypatch.setattr(query_cache_module.lightrag_service, "get_pipeline_status", get_pipeline_status)
+    
+    # Finishes on the second poll instead of failing on the comparison
+    await wait_for_indexing(started_at)
+    
+    assert query_cache.stats()["indexing"] is False
+
+
+@pytest.mark.asyncio
+async def test_indexing_watches_are_cancelled_at_shutdown(monkeypatch):
+    async def get_pipeline_status():
+        return {"busy": True, "job_start": None}
+    
+    monkeypatch.setattr(query_cache_module, "INDEXING_POLL_INTERVAL", 0)
+    monkeypatch.setattr(query_cache_module.lightrag_service, "get_pipeline_status", get_pipeline_status)
+    
+    watch_indexing(datetime.now(timezone.utc))
+    await asyncio.sleep(0.01)
+    assert query_cache.stats()["indexing"] is True
+    
+    await cancel_indexing_watches()
+    
+    assert query_cache.stats()["indexing"] is False